@@ -0,0 +1,96 @@
+# src/archive.py
+# Streams a batch into one ZIP or TAR archive instead of thousands of loose files: workers
+# render into memory and this process appends each sticker to the archive as it arrives,
+# so the output is one sequential write with no temp files. A manifest.csv member maps
+# each batch index to its device ID and member name.
+
+import csv
+import io
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from .utils import extract_slug
+
+ARCHIVE_MANIFEST_NAME = "manifest.csv"
+
+# Suffix -> archive kind; tar variants are written in streaming mode ("w|...")
+ARCHIVE_FORMATS = {
+    ".zip": "zip",
+    ".tar": "w|",
+    ".tar.gz": "w|gz",
+    ".tgz": "w|gz",
+    ".tar.xz": "w|xz",
+}
+
+
+def archive_format(path) -> str:
+    name = Path(path).name.lower()
+    # Longest suffix first so ".tar.gz" wins over ".gz"
+    for suffix in sorted(ARCHIVE_FORMATS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return ARCHIVE_FORMATS[suffix]
+    raise ValueError(f"Unknown archive type '{path}' (use {', '.join(ARCHIVE_FORMATS)})")
+
+
+class BatchArchive:
+    """
+    Collects rendered batch items (batch.ItemResult with data) into a ZIP or TAR file.
+    Members are named after the result filenames; manifest.csv is written last,
+    sorted by batch index, and lists failed items too (with an empty member name).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._kind = archive_format(self.path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self._kind == "zip":
+            self._archive = zipfile.ZipFile(self.path, "w")
+        else:
+            self._archive = tarfile.open(str(self.path), self._kind)
+        self._rows = []
+
+    def add(self, result):
+        """Appends one rendered item (or records its failure in the manifest)."""
+        member = ""
+        if not result.error:
+            member = Path(result.filename).name
+            self._write_member(member, result.data)
+        self._rows.append((result.index, extract_slug(result.url), result.url, result.label or "", member, result.error or ""))
+
+    def add_file(self, name: str, data: bytes):
+        """Adds an extra member that is not a batch item (e.g. a report); not listed in the manifest."""
+        self._write_member(name, data)
+
+    def _write_member(self, name: str, data: bytes):
+        if self._kind == "zip":
+            # PNGs are already deflated; only text (SVG, CSV) is worth compressing again
+            compression = zipfile.ZIP_STORED if name.lower().endswith(".png") else zipfile.ZIP_DEFLATED
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = compression
+            self._archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        """Writes manifest.csv and finishes the archive."""
+        if self._archive is None:
+            return
+        text = io.StringIO(newline="")
+        writer = csv.writer(text)
+        writer.writerow(["index", "device_id", "url", "label", "member", "error"])
+        writer.writerows(sorted(self._rows))
+        try:
+            self._write_member(ARCHIVE_MANIFEST_NAME, text.getvalue().encode("utf-8"))
+        finally:
+            self._archive.close()
+            self._archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,366 @@
+# src/batch.py
+# Batch helpers shared by the GUI and the headless CLI
+
+import io
+import os
+from collections import namedtuple
+from pathlib import Path
+from .generator import get_tag_layout
+from .encode_cache import ENCODE_CACHE_ENV_VAR, get_encode_cache
+from . import timing
+from .utils import extract_slug
+from .writer import ImageWriter, save_png
+from .sticker import StickerSpec, render_image, render_to
+from .verify import VerifyResult, should_verify, verify_qr_image
+
+DEFAULT_SETTINGS = {
+    "mode": "rect",             # "rect" or "luggage"
+    "version": 4,
+    "error_level": "M",
+    "font_path": None,          # caption font, None = auto-detect
+    "encode_cache_path": None,  # optional SQLite file shared by runs, see encode_cache.py
+    # Rectangular QR
+    "width_mm": 50.0,
+    "height_mm": 30.0,
+    "dpi": 300,
+    "output_svg": False,
+    "include_url_text": False,
+    # Luggage tag QR
+    "template_path": None,
+    "qr_zone": (0, 0, 827, 472),
+    "layout_path": None,        # JSON tag layout (layout.py); replaces template_path/qr_zone
+    # PNG output (see writer.py); colour modes only apply to rectangular stickers
+    "png_compress_level": 6,
+    "png_optimize": False,
+    "png_color": "rgb",
+    "writer_threads": 2,        # background PNG writer threads per worker process
+    "bulk_render": True,        # rectangular PNGs in NumPy batches when NumPy is installed (bulk.py)
+    "low_memory": False,        # PNGs built and written in strips, peak RSS per sticker (lowmem.py)
+    # Scan check of the written PNGs (see verify.py): 0 = off, 1 = every sticker, N = 1 in N
+    "verify_every": 0,
+    "verify_min_module_px": 2.0,
+    "verify_min_quiet_zone": 4,  # modules; ISO 18004 asks for 4
+    # Per-stage timers in the workers (see timing.py), summed into this process's totals
+    "timing": False,
+}
+
+
+def make_settings(**overrides) -> dict:
+    """Returns a copy of the default batch settings with the given values replaced."""
+    unknown = set(overrides) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown batch setting(s): {', '.join(sorted(unknown))}")
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(overrides)
+    return settings
+
+
+def output_extension(settings: dict) -> str:
+    if settings["mode"] == "rect" and settings["output_svg"]:
+        return ".svg"
+    return ".png"
+
+
+def batch_filename(saved_dir, index: int, url: str, settings: dict) -> str:
+    """Deterministic output name for the index-th item of a batch: '{i:03d}_{slug}.ext'."""
+    slug = extract_slug(url)
+    return str(Path(saved_dir) / f"{index:03d}_{slug}{output_extension(settings)}")
+
+
+def render_sticker(url: str, filename, settings: dict, on_version_adjusted=None, caption=None, writer=None, spec=None):
+    """
+    Renders one sticker to filename using the batch settings (caption defaults to the URL).
+    filename may also be a binary file object. With a writer.ImageWriter, PNGs are handed
+    to it and its Future is returned; otherwise the file is written before returning.
+    spec is the settings' sticker.StickerSpec when the caller already has it.
+    """
+    spec = spec or StickerSpec.from_settings(settings)
+    if writer is not None and not spec.is_svg:
+        img = render_image(url, spec, caption, on_version_adjusted)
+        return writer.submit(img, filename, spec.png_dpi)
+    render_to(url, spec, filename, caption, on_version_adjusted)
+    return None
+
+
+# ======= Parallel batch engine =======
+
+# One sticker to render; label (optional) replaces the URL as the caption
+BatchJob = namedtuple("BatchJob", ["index", "url", "filename", "label"])
+
+# One rendered (or failed) batch item; error is None on success, skipped is True
+# when a manifest showed the item was already done, data holds the file contents
+# when the batch was rendered in memory (nothing is written to filename then) and
+# check is the verify.VerifyResult for items that were scan-checked and peak_rss
+# the worker's peak RSS in bytes while rendering the item (low-memory batches only;
+# the process peak so far where lowmem.reset_peak_rss() is not supported)
+ItemResult = namedtuple(
+    "ItemResult", ["index", "url", "filename", "error", "note", "label", "skipped", "data", "check", "peak_rss"],
+    defaults=(None, False, None, None, None)
+)
+
+
+def iter_batch_jobs(records, saved_dir, settings: dict):
+    """Lazily turns csv_input.BatchRecords into BatchJobs with their deterministic output filenames."""
+    for record in records:
+        url = record.url
+        yield BatchJob(record.index, url, batch_filename(saved_dir, record.index, url, settings), record.label)
+
+
+def _chunked(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_chunk(chunk, settings: dict, in_memory: bool = False):
+    """
+    Renders a list of BatchJobs and returns one ItemResult per job.
+    Runs inside the worker processes, so errors are collected rather than raised.
+    PNGs are written by a small thread pool while the next sticker renders.
+    With in_memory, nothing is written: each result carries the file bytes instead.
+    """
+    spec = StickerSpec.from_settings(settings)
+    if settings.get("low_memory") and not spec.is_svg:
+        return [_check(_render_low_memory(job, spec, in_memory), settings) for job in chunk]
+    images = bulk_images(chunk, spec, settings)
+    if in_memory:
+        if images is not None:
+            return [_check(_bulk_to_bytes(job, spec, img, error), settings) for job, (img, error) in zip(chunk, images)]
+        return [_check(_render_to_bytes(job, settings, spec), settings) for job in chunk]
+
+    pending = []  # (job, notes, future or None, error)
+    with ImageWriter(settings["writer_threads"], png_options=spec.png_options) as writer:
+        if images is not None:
+            for job, (img, error) in zip(chunk, images):
+                try:
+                    future = writer.submit(img, job.filename, spec.png_dpi) if error is None else None
+                except Exception as e:
+                    future, error = None, e
+                pending.append((job, [], future, error))
+        else:
+            for job in chunk:
+                notes = []
+
+                def note_version(requested, actual, _url):
+                    notes.append(f"version {requested} too small, used version {actual}")
+
+                try:
+                    future = render_sticker(job.url, job.filename, settings, note_version, job.label, writer, spec)
+                    pending.append((job, notes, future, None))
+                except Exception as e:
+                    pending.append((job, notes, None, e))
+
+    # All writes are finished once the writer is closed
+    results = []
+    for job, notes, future, error in pending:
+        if error is None and future is not None:
+            error = future.exception()
+        if error is None:
+            result = ItemResult(job.index, job.url, job.filename, None, "; ".join(notes) or None, job.label)
+            results.append(_check(result, settings))
+        else:
+            results.append(ItemResult(job.index, job.url, job.filename, f"{type(error).__name__}: {error}", None, job.label))
+    return results
+
+
+def bulk_images(jobs, spec: StickerSpec, settings: dict):
+    """
+    (image, error) per job from bulk.BulkRenderer, or None when settings["bulk_render"] is
+    off or the spec cannot be rendered in bulk (the caller then renders one by one).
+    """
+    if not settings.get("bulk_render"):
+        return None
+    from . import bulk  # NumPy is only imported by the processes that render
+    if not bulk.supports(spec):
+        return None
+    return bulk.renderer_for(spec).render((job.url, job.label) for job in jobs)
+
+
+def _bulk_to_bytes(job: BatchJob, spec: StickerSpec, img, error) -> ItemResult:
+    if error is None:
+        buffer = io.BytesIO()
+        try:
+            save_png(img, buffer, spec.png_dpi, spec.png_options)
+            return ItemResult(job.index, job.url, job.filename, None, None, job.label, data=buffer.getvalue())
+        except Exception as e:
+            error = e
+    return ItemResult(job.index, job.url, job.filename, f"{type(error).__name__}: {error}", None, job.label)
+
+
+def _render_low_memory(job: BatchJob, spec: StickerSpec, in_memory: bool) -> ItemResult:
+    """Builds and writes one PNG strip by strip (no writer threads, nothing kept afterwards)."""
+    from . import lowmem
+    notes = []
+
+    def note_version(requested, actual, _url):
+        notes.append(f"version {requested} too small, used version {actual}")
+
+    buffer = io.BytesIO() if in_memory else None
+    lowmem.reset_peak_rss()
+    try:
+        rows = lowmem.sticker_rows(job.url, spec, job.label, note_version)
+        lowmem.write_png(rows, buffer if in_memory else job.filename, spec.png_dpi, spec.png_options)
+        del rows
+    except Exception as e:
+        return ItemResult(job.index, job.url, job.filename, f"{type(e).__name__}: {e}", None, job.label,
+                          peak_rss=lowmem.peak_rss())
+    return ItemResult(job.index, job.url, job.filename, None, "; ".join(notes) or None, job.label,
+                      data=buffer.getvalue() if in_memory else None, peak_rss=lowmem.peak_rss())
+
+
+def _render_to_bytes(job: BatchJob, settings: dict, spec: StickerSpec) -> ItemResult:
+    notes = []
+
+    def note_version(requested, actual, _url):
+        notes.append(f"version {requested} too small, used version {actual}")
+
+    try:
+        data = render_to(job.url, spec, None, job.label, note_version).getvalue()
+    except Exception as e:
+        return ItemResult(job.index, job.url, job.filename, f"{type(e).__name__}: {e}", None, job.label)
+    return ItemResult(job.index, job.url, job.filename, None, "; ".join(notes) or None, job.label, data=data)
+
+
+def _check(result: ItemResult, settings: dict) -> ItemResult:
+    """Scan-checks a rendered PNG when settings["verify_every"] selects it (still in the worker)."""
+    if result.error or settings["output_svg"] and settings["mode"] == "rect":
+        return result
+    if not should_verify(result.index, settings["verify_every"]):
+        return result
+    try:
+        check = verify_qr_image(
+            result.data if result.data is not None else result.filename, result.url,
+            settings["version"], settings["error_level"], settings["verify_min_module_px"], settings["verify_min_quiet_zone"]
+        )
+    except Exception as e:
+        check = VerifyResult(False, None, None, None, f"{type(e).__name__}: {e}")
+    return result._replace(check=check)
+
+
+def _render_chunk_timed(chunk, settings: dict, in_memory: bool = False):
+    """render_chunk() in a pool worker: also returns the stage times of this chunk (or None)."""
+    results = render_chunk(chunk, settings, in_memory)
+    return results, (timing.take() if timing.is_enabled() else None)
+
+
+def init_worker(settings: dict):
+    """Warms the per-process caches before a worker renders its first chunk."""
+    if settings["timing"]:
+        timing.enable()
+    # The store connects lazily in each process; a handle inherited over fork is dropped unused
+    store_path = settings["encode_cache_path"] or os.environ.get(ENCODE_CACHE_ENV_VAR)
+    if store_path:
+        get_encode_cache().open_store(store_path)
+    if settings["mode"] == "luggage":
+        try:
+            # Decodes the template and pre-renders the layout's static layers
+            get_tag_layout(settings["template_path"], tuple(settings["qr_zone"]), settings["font_path"], settings["layout_path"])
+        except (OSError, ValueError):
+            pass  # reported per item by render_chunk instead of breaking the pool
+
+
+def iter_batch_results(jobs, settings: dict, workers=None, chunk_size: int = 32, manifest=None, cancel_event=None,
+                       in_memory: bool = False, pool=None):
+    """
+    Renders BatchJobs across a pool of worker processes, yielding ItemResults as they finish.
+
+    Jobs are sent to the workers in chunks of chunk_size to keep the per-task
+    overhead low, and only a few chunks per worker are in flight at once, so the
+    jobs iterable is consumed lazily and memory stays flat for any batch size.
+    With a manifest.BatchManifest, jobs it already lists as done are yielded as
+    skipped results without rendering, and every rendered result is recorded in it.
+    Setting cancel_event (a threading.Event) stops the run: queued chunks are
+    cancelled and only the chunks already running are finished.
+    With in_memory, workers send the rendered files back in ItemResult.data instead
+    of writing them, e.g. for archive.BatchArchive (no manifest in that case).
+    pool is an already running ProcessPoolExecutor of `workers` processes (started with
+    init_worker) to use instead of starting one for this run, e.g. the job server's.
+    """
+    if manifest is None:
+        yield from _render_jobs(jobs, settings, workers, chunk_size, cancel_event, in_memory, pool)
+        return
+
+    skipped = []
+
+    def pending_jobs():
+        for job in jobs:
+            if manifest.is_done(job):
+                skipped.append(ItemResult(job.index, job.url, job.filename, None, None, job.label, True))
+            else:
+                yield job
+
+    for result in _render_jobs(pending_jobs(), settings, workers, chunk_size, cancel_event, pool=pool):
+        yield from skipped
+        skipped.clear()
+        manifest.record(result)
+        yield result
+    yield from skipped
+
+
+def _render_jobs(jobs, settings: dict, workers=None, chunk_size: int = 32, cancel_event=None, in_memory: bool = False,
+                 pool=None):
+    workers = workers or os.cpu_count() or 1
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    if pool is not None:
+        yield from _render_in_pool(pool, jobs, settings, workers, chunk_size, cancelled, in_memory)
+        return
+
+    if workers == 1:
+        # No pool needed: render in this process
+        init_worker(settings)
+        for chunk in _chunked(jobs, chunk_size):
+            if cancelled():
+                return
+            yield from render_chunk(chunk, settings, in_memory)
+        return
+
+    # Only pooled runs need multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(settings,)) as pool:
+        yield from _render_in_pool(pool, jobs, settings, workers, chunk_size, cancelled, in_memory)
+
+
+def _render_in_pool(pool, jobs, settings: dict, workers: int, chunk_size: int, cancelled, in_memory: bool):
+    from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+    max_in_flight = workers * 2
+    pending = set()
+    try:
+        for chunk in _chunked(jobs, chunk_size):
+            if cancelled():
+                return
+            pending.add(pool.submit(_render_chunk_timed, chunk, settings, in_memory))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from _chunk_results(future)
+        for future in as_completed(pending):
+            pending.discard(future)
+            yield from _chunk_results(future)
+            if cancelled():
+                return
+    finally:
+        # Drop whatever has not started yet (cancel, error or the caller stopped early)
+        for future in pending:
+            future.cancel()
+
+
+def _chunk_results(future):
+    results, stages = future.result()
+    if stages:
+        timing.merge(stages)
+    return results
+
+
+def run_batch(jobs, settings: dict, workers=None, chunk_size: int = 32, manifest=None, cancel_event=None):
+    """Renders all jobs (see iter_batch_results) and returns the ItemResults sorted by index."""
+    results = list(iter_batch_results(jobs, settings, workers, chunk_size, manifest, cancel_event))
+    results.sort(key=lambda r: r.index)
+    return results
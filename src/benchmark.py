@@ -0,0 +1,273 @@
+# src/benchmark.py
+# Benchmark suite for the generator hot paths: python -m src.benchmark
+# Times every generator over QR versions, error levels, DPIs, PNG/SVG and with/without
+# the URL caption, with per-stage timings and peak memory, and writes the results as JSON
+# so runs can be compared (--baseline). Runs offline with assets/tag_template.png.
+
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import PIL
+import qrcode
+from PIL import Image
+from . import timing
+from .encode_cache import get_encode_cache
+from .generator import (
+    ERROR_CORRECTION_MAP, DEFAULT_TEMPLATE_PATH, encode_qr, render_qr_modules, preload_templates,
+    create_rectangle_qr_image, create_rectangle_qr_image_2, create_luggage_tag_qr_image,
+)
+
+SAMPLE_URL = "https://my.sensibee.io/register?deviceId=faithful-hoverfly-66"
+
+VERSIONS = list(range(1, 11))
+ERROR_LEVELS = ["L", "M", "Q", "H"]
+DPIS = [150, 300, 600]
+
+# Smaller matrix for a quick check
+QUICK_VERSIONS = [1, 4, 10]
+QUICK_ERROR_LEVELS = ["M", "H"]
+QUICK_DPIS = [300]
+
+
+def _max_rss_kb():
+    """Process high-water RSS in KiB, or None where the resource module is unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # macOS reports bytes
+
+
+def iter_cases(quick: bool = False):
+    """Yields (generator name, kwargs) for every benchmark case."""
+    versions = QUICK_VERSIONS if quick else VERSIONS
+    levels = QUICK_ERROR_LEVELS if quick else ERROR_LEVELS
+    dpis = QUICK_DPIS if quick else DPIS
+
+    for version, level, dpi, svg, caption in itertools.product(versions, levels, dpis, [False, True], [False, True]):
+        yield "rectangle", dict(version=version, error_level=level, dpi=dpi, output_svg=svg, include_url_text=caption)
+    for version, level, dpi in itertools.product(versions, levels, dpis):
+        # Always draws the caption; PNG only
+        yield "rectangle_2", dict(version=version, error_level=level, dpi=dpi, output_svg=False, include_url_text=True)
+    for version, level in itertools.product(versions, levels):
+        # Fixed-size template: no DPI/SVG/caption options
+        yield "luggage_tag", dict(version=version, error_level=level)
+
+
+def _run_case(name: str, case: dict, filename: str):
+    if name == "rectangle":
+        create_rectangle_qr_image(SAMPLE_URL, 50, 30, case["dpi"], case["version"], case["error_level"],
+                                  filename, case["output_svg"], case["include_url_text"])
+    elif name == "rectangle_2":
+        create_rectangle_qr_image_2(SAMPLE_URL, 50, 30, case["dpi"], case["version"], case["error_level"], filename)
+    else:
+        create_luggage_tag_qr_image(SAMPLE_URL, case["version"], case["error_level"], filename,
+                                    on_version_adjusted=lambda *_: None)
+
+
+def benchmark_case(name: str, case: dict, out_dir: Path, repeat: int) -> dict:
+    """
+    Times one case repeat times; stage timings are averaged per call, memory is the tracemalloc
+    peak of one extra call made after the timed runs, so tracing does not slow them down.
+    The encode cache is bypassed so every call really encodes, as the first sticker of a batch does.
+    """
+    ext = ".svg" if case.get("output_svg") else ".png"
+    filename = str(out_dir / f"{name}{ext}")
+    with get_encode_cache().disabled():
+        _run_case(name, case, filename)  # warm-up: fonts, template cache
+
+        timing.reset()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            _run_case(name, case, filename)
+            timings.append((time.perf_counter() - start) * 1000)
+        stages = timing.snapshot()
+
+        tracemalloc.start()
+        try:
+            _run_case(name, case, filename)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "generator": name,
+        **case,
+        "repeat": repeat,
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "stages_ms": {stage: data["total_ms"] / repeat for stage, data in sorted(stages.items())},
+        # Python-level peak (tracemalloc) plus the process RSS high-water mark, which
+        # also covers Pillow's image buffers (monotonic across cases)
+        "py_peak_kb": peak // 1024,
+        "max_rss_kb": _max_rss_kb(),
+        "output_bytes": Path(filename).stat().st_size,
+    }
+
+
+def run_suite(quick: bool = False, repeat: int = 5, progress=None) -> dict:
+    if not DEFAULT_TEMPLATE_PATH.exists():
+        raise FileNotFoundError(f"Bundled template missing: {DEFAULT_TEMPLATE_PATH}")
+    preload_templates()
+    cases = list(iter_cases(quick))
+    results = []
+    was_enabled = timing.is_enabled()
+    timing.enable()
+    try:
+        with tempfile.TemporaryDirectory(prefix="qr-bench-") as tmp:
+            for i, (name, case) in enumerate(cases, start=1):
+                results.append(benchmark_case(name, case, Path(tmp), repeat))
+                if progress is not None:
+                    progress(i, len(cases), results[-1])
+    finally:
+        timing.enable(was_enabled)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pillow": PIL.__version__,
+            "qrcode": getattr(qrcode, "__version__", None) or _package_version("qrcode"),
+            "max_rss_kb": _max_rss_kb(),
+        },
+        "quick": quick,
+        "results": results,
+    }
+
+
+def _package_version(name: str):
+    try:
+        from importlib.metadata import version
+        return version(name)
+    except Exception:
+        return None
+
+
+def case_key(result: dict):
+    return tuple(result.get(k) for k in ("generator", "version", "error_level", "dpi", "output_svg", "include_url_text"))
+
+
+def compare_runs(current: dict, baseline: dict, threshold: float = 1.10):
+    """
+    Returns (case key, baseline ms, current ms, ratio) for cases present in both runs,
+    slowest ratio first. Ratios above threshold count as regressions.
+    """
+    base = {case_key(r): r["median_ms"] for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        key = case_key(r)
+        if key in base and base[key] > 0:
+            rows.append((key, base[key], r["median_ms"], r["median_ms"] / base[key]))
+    rows.sort(key=lambda row: row[3], reverse=True)
+    regressions = [row for row in rows if row[3] > threshold]
+    return rows, regressions
+
+
+# ======= QR raster stage: box_size=10 + LANCZOS vs direct module rendering =======
+
+def _time_it(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def legacy_qr_raster(url: str, version: int, error_level: str, qr_height: int) -> Image.Image:
+    """The pre-direct-render path: box_size=10 image, RGB convert, then LANCZOS resize."""
+    qr = qrcode.QRCode(version=version, error_correction=ERROR_CORRECTION_MAP[error_level], box_size=10, border=1)
+    qr.add_data(url)
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
+    return qr_img.resize((qr_height, qr_height), Image.Resampling.LANCZOS)
+
+
+def direct_qr_raster(url: str, version: int, error_level: str, qr_height: int) -> Image.Image:
+    matrix, _ = encode_qr(url, version, error_level)
+    return render_qr_modules(matrix, qr_height)
+
+
+def compare_qr_raster(dpis=(150, 300, 600, 1200), height_mm: float = 30, repeat: int = 20):
+    """
+    Before/after timings of the QR raster stage for a height_mm sticker at each DPI.
+    Both sides encode every time: the encode cache is bypassed for the direct path too.
+    """
+    rows = []
+    for dpi in dpis:
+        qr_height = int(int((height_mm / 25.4) * dpi) * 0.75)
+        legacy_ms = _time_it(lambda: legacy_qr_raster(SAMPLE_URL, 4, "M", qr_height), repeat)
+        with get_encode_cache().disabled():
+            direct_ms = _time_it(lambda: direct_qr_raster(SAMPLE_URL, 4, "M", qr_height), repeat)
+        rows.append({"dpi": dpi, "qr_px": qr_height, "legacy_ms": legacy_ms, "direct_ms": direct_ms})
+    return rows
+
+
+def print_raster_comparison(repeat: int):
+    print(f"{'DPI':>6} {'QR px':>7} {'legacy ms':>10} {'direct ms':>10} {'speedup':>8}")
+    for row in compare_qr_raster(repeat=repeat):
+        speedup = row["legacy_ms"] / row["direct_ms"] if row["direct_ms"] else float("inf")
+        print(f"{row['dpi']:>6} {row['qr_px']:>7} {row['legacy_ms']:>10.2f} {row['direct_ms']:>10.2f} {speedup:>7.1f}x")
+
+
+def print_summary(run: dict):
+    """Per generator: median time and average per-stage breakdown across all cases."""
+    by_generator = {}
+    for r in run["results"]:
+        by_generator.setdefault(r["generator"], []).append(r)
+    for name, rows in by_generator.items():
+        stages = {}
+        for r in rows:
+            for stage, ms in r["stages_ms"].items():
+                stages.setdefault(stage, []).append(ms)
+        stage_text = ", ".join(f"{stage} {statistics.mean(ms):.2f}" for stage, ms in sorted(stages.items()))
+        print(f"{name:<12} {len(rows):>4} cases  median {statistics.median(r['median_ms'] for r in rows):7.2f} ms"
+              f"  peak {max(r['py_peak_kb'] for r in rows):>6} KiB  stages (ms): {stage_text}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.benchmark", description="Benchmark the QR sticker generators.")
+    parser.add_argument("--quick", action="store_true", help="small case matrix (versions 1/4/10, levels M/H, 300 DPI)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case (median is reported)")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="JSON results file (default: bench_results.json)")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.10, help="slowdown ratio counted as a regression (default: 1.10)")
+    parser.add_argument("--compare-raster", action="store_true",
+                        help="only compare the old box_size=10 + LANCZOS QR raster with direct module rendering")
+    args = parser.parse_args(argv)
+
+    if args.compare_raster:
+        print_raster_comparison(args.repeat)
+        return 0
+
+    def progress(i, total, result):
+        print(f"\r[{i}/{total}] {result['generator']:<12} {result['median_ms']:8.2f} ms", end="", file=sys.stderr)
+
+    run = run_suite(args.quick, args.repeat, progress)
+    print(file=sys.stderr)
+    Path(args.output).write_text(json.dumps(run, indent=2), encoding="utf-8")
+    print_summary(run)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        rows, regressions = compare_runs(run, baseline, args.threshold)
+        print(f"Compared {len(rows)} cases with {args.baseline}: {len(regressions)} slower than x{args.threshold:.2f}")
+        for key, base_ms, cur_ms, ratio in regressions[:20]:
+            print(f"  {'/'.join(str(k) for k in key if k is not None)}: {base_ms:.2f} -> {cur_ms:.2f} ms (x{ratio:.2f})")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
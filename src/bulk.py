@@ -0,0 +1,151 @@
+# src/bulk.py
+# Bulk renderer for rectangular PNG stickers. Every sticker of a batch has the same
+# canvas size and layout, so instead of building each one with Pillow the renderer
+# encodes a group of URLs, stacks the module matrices into one NumPy array, scales them
+# all with one repeat per axis and writes them into a preallocated canvas buffer that is
+# reused for every group. Only the caption is still drawn per sticker.
+#
+# NumPy is optional: without it (or for SVG / luggage specs) supports() is False and
+# callers keep using sticker.render_image(). The output is pixel-identical to it.
+
+import threading
+from PIL import Image, ImageDraw
+from .generator import encode_qr, rect_sticker_size, rect_qr_position, fit_rect_caption
+from .timing import stage
+
+try:
+    import numpy as np
+except ImportError:  # optional, see requirements.txt
+    np = None
+
+# Upper bound for the canvas buffer in pixels (1 byte each): 32 stickers of 50x30 mm at
+# 300 DPI use ~7 MB; larger stickers or DPIs render in smaller groups
+MAX_CANVAS_PIXELS = 16_000_000
+
+# One renderer (and canvas) per thread, kept while its spec is used
+_local = threading.local()
+
+
+def supports(spec) -> bool:
+    """True when spec (a sticker.StickerSpec) can be rendered in bulk here."""
+    return np is not None and spec.mode == "rect" and not spec.output_svg
+
+
+def renderer_for(spec) -> "BulkRenderer":
+    """The calling thread's BulkRenderer for spec, so batch chunks reuse one canvas buffer."""
+    renderer = getattr(_local, "renderer", None)
+    if renderer is None or renderer.spec != spec:
+        renderer = _local.renderer = BulkRenderer(spec)
+    return renderer
+
+
+class BulkRenderer:
+    """
+    Renders many stickers of one sticker.StickerSpec. render() takes (url, caption) pairs
+    and yields (image, error) per pair, in order: the image is None when the item failed
+    and error holds the exception. Images are RGB, or "L" when the spec saves a
+    non-RGB PNG colour mode (writer.convert_for_png starts from greyscale anyway).
+    """
+
+    def __init__(self, spec, group_size: int = 32):
+        if not supports(spec):
+            raise ValueError("BulkRenderer needs NumPy and a rectangular PNG sticker spec")
+        self.spec = spec
+        self.width_px, self.height_px, self.qr_height = rect_sticker_size(spec.width_mm, spec.height_mm, spec.dpi)
+        self.group_size = max(1, min(group_size, MAX_CANVAS_PIXELS // (self.width_px * self.height_px)))
+        # The white background is painted once; after that only the QR boxes are rewritten
+        self._canvas = np.full((self.group_size, self.height_px, self.width_px), 255, dtype=np.uint8)
+        self._slot_boxes = [None] * self.group_size  # (x, y, qr_px) last written to each slot
+
+    def render(self, items):
+        group = []
+        for item in items:
+            group.append(item)
+            if len(group) == self.group_size:
+                yield from self._render_group(group)
+                group = []
+        if group:
+            yield from self._render_group(group)
+
+    def _render_group(self, group):
+        spec = self.spec
+        matrices = []
+        errors = {}
+        for i, (url, _caption) in enumerate(group):
+            try:
+                matrices.append(encode_qr(url, spec.version, spec.error_level)[0])
+            except Exception as e:
+                matrices.append(None)
+                errors[i] = e
+
+        # Version bumps give a few URLs a bigger matrix: place each run of same-sized
+        # matrices as one stack (normally the whole group is one run)
+        start = 0
+        for end in range(1, len(group) + 1):
+            if end == len(group) or _size(matrices[end]) != _size(matrices[start]):
+                if matrices[start] is not None:
+                    try:
+                        self._place_stack(start, matrices[start:end])
+                    except Exception as e:
+                        # Only these items fail; the rest of the group still renders
+                        errors.update((i, e) for i in range(start, end))
+                start = end
+
+        mode = "RGB" if spec.png_color == "rgb" else "L"
+        for i, (url, caption) in enumerate(group):
+            if i in errors:
+                yield None, errors[i]
+                continue
+            try:
+                yield self._frame(self._canvas[i], caption or url, mode), None
+            except Exception as e:
+                yield None, e
+
+    def _place_stack(self, start: int, matrices):
+        """Scales same-sized matrices together, straight into canvas slots start, start + 1, ..."""
+        modules = len(matrices[0])
+        scale = max(1, self.qr_height // modules)
+        qr_px = modules * scale
+        x, y = rect_qr_position(self.width_px, self.height_px, self.qr_height, qr_px, self.spec.include_url_text)
+        end = start + len(matrices)
+        with stage("composite"):
+            for slot in range(start, end):
+                if self._slot_boxes[slot] != (x, y, qr_px):
+                    # A different QR size was here before: repaint the slot's background
+                    self._canvas[slot].fill(255)
+                    self._slot_boxes[slot] = (x, y, qr_px)
+        with stage("resize"):
+            # Module rows are bytes of 0/1 (1 = dark): one buffer for the whole stack
+            dark = np.frombuffer(b"".join(row for matrix in matrices for row in matrix), dtype=np.uint8)
+            pixels = (1 - dark.reshape(len(matrices), modules, 1, modules, 1)) * np.uint8(255)
+            if x >= 0 and y >= 0 and x + qr_px <= self.width_px and y + qr_px <= self.height_px:
+                # Splitting each QR box axis into (module, pixel within module) lets one
+                # broadcast assignment repeat every module scale x scale times in place
+                boxes = self._canvas[start:end, y:y + qr_px, x:x + qr_px]
+                boxes.reshape(len(matrices), modules, scale, modules, scale)[...] = pixels
+            else:
+                # The QR is bigger than the sticker (narrow or short stickers): clip it
+                # to the canvas the way Image.paste() does in generator.compose_rect_sticker
+                full = np.broadcast_to(pixels, (len(matrices), modules, scale, modules, scale))
+                full = full.reshape(len(matrices), qr_px, qr_px)
+                left, top = max(x, 0), max(y, 0)
+                right, bottom = min(x + qr_px, self.width_px), min(y + qr_px, self.height_px)
+                if right > left and bottom > top:
+                    self._canvas[start:end, top:bottom, left:right] = full[:, top - y:bottom - y, left - x:right - x]
+
+    def _frame(self, pixels, text: str, mode: str) -> Image.Image:
+        """Copies one canvas slot into its own image (it outlives the buffer) and adds the caption."""
+        spec = self.spec
+        if spec.include_url_text:
+            text, font, position = fit_rect_caption(text, self.width_px, self.qr_height, spec.dpi, spec.font_path)
+        with stage("composite"):
+            # Read-only view of the slot; convert()/copy() make the one copy the image keeps
+            view = Image.frombuffer("L", (self.width_px, self.height_px), pixels, "raw", "L", 0, 1)
+            img = view.convert("RGB") if mode == "RGB" else view.copy()
+            if spec.include_url_text:
+                ImageDraw.Draw(img).text(position, text, fill="black", font=font)
+            return img
+
+
+def _size(matrix):
+    return None if matrix is None else len(matrix)
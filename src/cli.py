@@ -0,0 +1,365 @@
+# src/cli.py
+# Headless command line entry point: python -m src.main batch <csv> --out <dir> ...
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from .batch import DEFAULT_SETTINGS, make_settings, iter_batch_jobs, iter_batch_results
+from .csv_input import iter_csv_records
+from .writer import PNG_COLOR_MODES
+from .qr_info import MIN_VERSION, MAX_VERSION
+from .manifest import BatchManifest, MANIFEST_FILENAME
+from .precheck import PRECHECK_REPORT_FILENAME, precheck_batch
+from .verify import VerifyReport, VERIFY_REPORT_FILENAME
+from .lowmem import MemoryReport, MEMORY_REPORT_FILENAME
+from . import timing
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.main batch",
+        description="Generate a batch of QR stickers from a CSV file without the GUI."
+    )
+    parser.add_argument("csv", help="CSV file: first line is the base URL, following lines are suffixes")
+    parser.add_argument("-o", "--out", help="folder to save the QR codes in")
+    parser.add_argument("--mode", choices=["rect", "luggage"], default=DEFAULT_SETTINGS["mode"],
+                        help="rectangular QR or luggage tag QR (default: rect)")
+
+    # --- CSV input ---
+    csv_group = parser.add_argument_group("CSV input")
+    csv_group.add_argument("--base-url", default=None,
+                           help="prefix for every row (then the first row is data too); use '' for a column of full URLs")
+    csv_group.add_argument("--column", default="0", help="column holding the suffix/URL, by 0-based index or header name (default: 0)")
+    csv_group.add_argument("--label-column", default=None, help="optional column whose text replaces the URL caption")
+    csv_group.add_argument("--header", action="store_true", help="the CSV has a header row")
+    csv_group.add_argument("--delimiter", default=",", help="CSV delimiter (default: ,)")
+    csv_group.add_argument("--keep-duplicates", action="store_true",
+                           help="render repeated URLs again instead of skipping them (they are still reported)")
+    csv_group.add_argument("--precheck-report", default=None, metavar="PATH",
+                           help=f"CSV of duplicate, too long and ambiguous rows (default: {PRECHECK_REPORT_FILENAME} next to the output)")
+
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: one per CPU core, 1 = no pool)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="stickers per work unit sent to a worker (default: 32)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help=f"re-render everything instead of skipping items {MANIFEST_FILENAME} lists as done")
+
+    # --- QR encoding settings ---
+    parser.add_argument("--version", type=int, default=DEFAULT_SETTINGS["version"], help="QR version 1-40 (default: 4)")
+    parser.add_argument("--error-level", choices=["L", "M", "Q", "H"], default=DEFAULT_SETTINGS["error_level"],
+                        type=str.upper, help="error correction level (default: M)")
+
+    parser.add_argument("--encode-cache", default=None, metavar="PATH",
+                        help="SQLite file that keeps encoded QR matrices between runs (default: $QR_STICKER_ENCODE_CACHE)")
+    parser.add_argument("--font", default=None,
+                        help="TrueType font for the URL caption (default: $QR_STICKER_FONT, then Arial/DejaVu Sans)")
+
+    # --- Rectangular QR settings ---
+    rect = parser.add_argument_group("rectangular QR")
+    rect.add_argument("--width-mm", type=float, default=DEFAULT_SETTINGS["width_mm"], help="sticker width in mm (default: 50)")
+    rect.add_argument("--height-mm", type=float, default=DEFAULT_SETTINGS["height_mm"], help="sticker height in mm (default: 30)")
+    rect.add_argument("--dpi", type=int, default=DEFAULT_SETTINGS["dpi"], help="output DPI (default: 300)")
+    rect.add_argument("--svg", action="store_true", help=".svg output (default is .png)")
+    rect.add_argument("--url-text", action="store_true", help="include the URL under the QR code")
+
+    # --- PNG output ---
+    png = parser.add_argument_group("PNG output")
+    png.add_argument("--png-compress", type=int, choices=range(10), default=DEFAULT_SETTINGS["png_compress_level"],
+                     metavar="0-9", help="zlib compression level, 0 = fastest, 9 = smallest (default: 6)")
+    png.add_argument("--png-optimize", action="store_true", help="extra compression pass for the smallest files (slow)")
+    png.add_argument("--png-color", choices=PNG_COLOR_MODES, default=DEFAULT_SETTINGS["png_color"],
+                     help="rgb (default), L greyscale, P 16-colour palette or 1 bilevel - much smaller black/white PNGs")
+    png.add_argument("--writer-threads", type=int, default=DEFAULT_SETTINGS["writer_threads"],
+                     help="threads writing PNGs in the background per worker (default: 2)")
+    png.add_argument("--no-bulk", action="store_true",
+                     help="render rectangular PNGs one by one instead of in NumPy batches (same output)")
+    png.add_argument("--low-memory", action="store_true",
+                     help="build and write each PNG in strips of rows (very high DPI / large stickers, many workers "
+                          "in little memory); --png-color P is written as greyscale")
+
+    # --- Timing / profiling ---
+    perf = parser.add_argument_group("timing and profiling")
+    perf.add_argument("--timings", action="store_true",
+                      help="print time spent per stage (encode, font fit, template, resize, composite, save) for the batch")
+    perf.add_argument("--timings-json", default=None, metavar="PATH", help="also write the stage timings as JSON")
+    perf.add_argument("--profile", default=None, metavar="PATH",
+                      help="run in a single process under cProfile and save the stats to PATH (implies -j 1)")
+    perf.add_argument("--memory-report", default=None, metavar="PATH",
+                      help=f"with --low-memory: CSV of the worker's peak RSS for each sticker "
+                           f"(default: {MEMORY_REPORT_FILENAME} next to the output)")
+
+    # --- Scan check ---
+    check = parser.add_argument_group("scan check", "read each written PNG back and check it encodes its URL")
+    check.add_argument("--verify", nargs="?", type=int, const=1, default=0, metavar="N",
+                       help="check every sticker, or 1 in N stickers with --verify N")
+    check.add_argument("--min-module-px", type=float, default=DEFAULT_SETTINGS["verify_min_module_px"],
+                       help="smallest QR module size in pixels that passes (default: 2)")
+    check.add_argument("--min-quiet-zone", type=int, default=DEFAULT_SETTINGS["verify_min_quiet_zone"],
+                       help="narrowest white margin around the QR code, in modules, that passes (default: 4)")
+    check.add_argument("--verify-report", default=None, metavar="PATH",
+                       help=f"CSV report of the checks (default: {VERIFY_REPORT_FILENAME} next to the output)")
+
+    # --- Archive output ---
+    parser.add_argument("--archive", default=None, metavar="PATH",
+                        help="write every sticker into one .zip, .tar, .tar.gz or .tar.xz (with a manifest.csv) instead of a folder")
+
+    # --- Print sheet output (rectangular QR only) ---
+    sheet = parser.add_argument_group("print sheet output", "pack the stickers onto pages of one .pdf/.tiff instead of one file each")
+    sheet.add_argument("--sheet", default=None, metavar="PATH", help="multi-page .pdf, .tif or .tiff to write")
+    sheet.add_argument("--page", default="A4", help="A4, Letter or label stock WIDTHxHEIGHT in mm (default: A4)")
+    sheet.add_argument("--margin-mm", type=float, default=10.0, help="page margin in mm (default: 10)")
+    sheet.add_argument("--gutter-mm", type=float, default=2.0, help="gap between stickers in mm (default: 2)")
+
+    # --- Luggage tag settings ---
+    tag = parser.add_argument_group("luggage tag QR")
+    tag.add_argument("--template", default=None, help="custom tag template PNG (default: assets/tag_template.png)")
+    tag.add_argument("--qr-zone", type=int, nargs=4, metavar=("X", "Y", "W", "H"),
+                     default=list(DEFAULT_SETTINGS["qr_zone"]), help="QR zone on the template (default: 0 0 827 472)")
+    tag.add_argument("--layout", default=None, metavar="JSON",
+                     help="tag layout file with QR, caption, text and logo zones (replaces --template/--qr-zone)")
+    return parser
+
+
+def settings_from_args(args) -> dict:
+    return make_settings(
+        mode=args.mode,
+        version=args.version,
+        error_level=args.error_level,
+        font_path=args.font,
+        encode_cache_path=args.encode_cache,
+        png_compress_level=args.png_compress,
+        png_optimize=args.png_optimize,
+        png_color=args.png_color,
+        writer_threads=args.writer_threads,
+        bulk_render=not args.no_bulk,
+        low_memory=args.low_memory,
+        verify_every=args.verify,
+        verify_min_module_px=args.min_module_px,
+        verify_min_quiet_zone=args.min_quiet_zone,
+        timing=bool(args.timings or args.timings_json),
+        width_mm=args.width_mm,
+        height_mm=args.height_mm,
+        dpi=args.dpi,
+        output_svg=args.svg,
+        include_url_text=args.url_text,
+        template_path=args.template,
+        qr_zone=tuple(args.qr_zone),
+        layout_path=args.layout,
+    )
+
+
+def make_sheet(args, records, settings: dict) -> int:
+    """Renders the batch straight onto print sheets in one PDF/TIFF."""
+    from .imposition import impose_stickers, iter_sheet_stickers
+    sheet_path = Path(args.sheet)
+    sheet_path.parent.mkdir(parents=True, exist_ok=True)
+    failed = 0
+
+    def report_error(job, e):
+        nonlocal failed
+        failed += 1
+        print(f"error: row {job.index} ({job.url}): {type(e).__name__}: {e}", file=sys.stderr)
+
+    start = time.perf_counter()
+    try:
+        jobs = iter_batch_jobs(records, sheet_path.parent, settings)
+        stickers = iter_sheet_stickers(jobs, settings, on_error=report_error)
+        count, pages = impose_stickers(
+            stickers, sheet_path, settings["dpi"], (settings["width_mm"], settings["height_mm"]),
+            args.page, args.margin_mm, args.gutter_mm
+        )
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"{count} QR codes on {pages} page(s) saved to {sheet_path} in {elapsed:.2f}s ({rate:.1f} stickers/sec)")
+    report_timings(args, count, elapsed)
+    if failed:
+        print(f"{failed} item(s) failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+def make_archive(args, records, settings: dict) -> int:
+    """Renders the batch in the worker pool and streams every sticker into one archive."""
+    from .archive import BatchArchive
+    count = failed = 0
+    start = time.perf_counter()
+    try:
+        jobs = iter_batch_jobs(records, "", settings)
+        report = VerifyReport(verify_report_path(args, Path(args.archive).parent))
+        memory = MemoryReport(memory_report_path(args, Path(args.archive).parent))
+        with BatchArchive(args.archive) as archive, report, memory:
+            for r in iter_batch_results(jobs, settings, args.workers, args.chunk_size, in_memory=True):
+                archive.add(r)
+                report.add(r)
+                memory.add(r)
+                if r.error:
+                    failed += 1
+                    print(f"error: row {r.index} ({r.url}): {r.error}", file=sys.stderr)
+                else:
+                    count += 1
+                    if r.note:
+                        print(f"warning: row {r.index} ({r.url}): {r.note}", file=sys.stderr)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"{count} QR codes saved to {args.archive} in {elapsed:.2f}s ({rate:.1f} stickers/sec)")
+    report_timings(args, count, elapsed)
+    print_verify_summary(report)
+    print_memory_summary(memory)
+    if failed:
+        print(f"{failed} item(s) failed", file=sys.stderr)
+    return 1 if failed or report.failed else 0
+
+
+def verify_report_path(args, output_dir) -> Path:
+    return Path(args.verify_report) if args.verify_report else Path(output_dir) / VERIFY_REPORT_FILENAME
+
+
+def print_verify_summary(report: VerifyReport):
+    if report.checked:
+        print(f"Scan check: {report.checked - report.failed} of {report.checked} checked stickers OK "
+              f"(report: {report.path})")
+    if report.failed:
+        print(f"{report.failed} sticker(s) failed the scan check", file=sys.stderr)
+
+
+def memory_report_path(args, output_dir) -> Path:
+    return Path(args.memory_report) if args.memory_report else Path(output_dir) / MEMORY_REPORT_FILENAME
+
+
+def print_memory_summary(memory: MemoryReport):
+    if memory.count:
+        print(f"Peak RSS: {memory.peak / 2**20:.1f} MB per worker process, reached at row {memory.peak_index} "
+              f"(report: {memory.path})")
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.profile:
+        # One process, so the profile (or py-spy attached to this PID) sees every stage
+        args.workers = 1
+        with timing.profile(args.profile):
+            code = run(parser, args)
+        print(f"Profile saved to {args.profile}")
+        return code
+    return run(parser, args)
+
+
+def report_timings(args, count: int, elapsed: float):
+    """Prints and/or exports the stage totals collected from all workers."""
+    if not (args.timings or args.timings_json):
+        return
+    data = timing.snapshot()
+    if args.timings:
+        print(timing.format_summary(data, count, elapsed))
+    if args.timings_json:
+        workers = args.workers or os.cpu_count() or 1
+        timing.write_json(args.timings_json, data, stickers=count, elapsed_s=round(elapsed, 3), workers=workers)
+        print(f"Stage timings written to {args.timings_json}")
+
+
+def run(parser, args) -> int:
+    if sum(bool(target) for target in (args.out, args.sheet, args.archive)) != 1:
+        parser.error("exactly one of --out, --sheet or --archive is required")
+    if args.sheet and (args.mode != "rect" or args.svg):
+        parser.error("--sheet only works with rectangular PNG stickers (--mode rect, no --svg)")
+    if args.layout and args.mode != "luggage":
+        parser.error("--layout is for luggage tags (--mode luggage)")
+    if args.verify and (args.sheet or args.svg):
+        parser.error("--verify checks PNG stickers written with --out or --archive")
+    if args.low_memory and args.sheet:
+        parser.error("--low-memory writes one PNG per sticker (--out or --archive)")
+    if args.memory_report and not args.low_memory:
+        parser.error("--memory-report needs --low-memory")
+    if args.verify < 0:
+        parser.error("--verify N must be 1 or more")
+    if not MIN_VERSION <= args.version <= MAX_VERSION:
+        parser.error(f"--version must be between {MIN_VERSION} and {MAX_VERSION}")
+    settings = settings_from_args(args)
+    if settings["timing"]:
+        timing.reset()
+        timing.enable()  # stages run in this process too (sheets, -j 1)
+
+    def read_records():
+        return iter_csv_records(
+            args.csv, base_url=args.base_url, column=args.column, label_column=args.label_column,
+            header=args.header, delimiter=args.delimiter
+        )
+
+    # One pass before rendering: skip duplicates and URLs no QR version holds, and fix
+    # the QR version for the whole batch up front (uniform sticker sizes)
+    try:
+        check = precheck_batch(read_records(), settings, args.keep_duplicates)
+        if check.issues:
+            report_path = Path(args.precheck_report) if args.precheck_report else \
+                Path(args.out or Path(args.sheet or args.archive).parent) / PRECHECK_REPORT_FILENAME
+            report_path.parent.mkdir(parents=True, exist_ok=True)
+            check.write_report(report_path)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    settings, longest = check.settings, check.longest
+    if longest is not None:
+        print(f"note: version {args.version} is too small for row {longest.index} ({len(longest.url)} chars), "
+              f"using version {settings['version']} for the whole batch", file=sys.stderr)
+    for line in check.summary_lines():
+        print(f"warning: {line}", file=sys.stderr)
+    if check.issues:
+        print(f"Input check: {check.to_render} of {check.total} rows to render (report: {report_path})", file=sys.stderr)
+    records = check.filter(read_records())
+
+    if args.sheet:
+        return make_sheet(args, records, settings)
+    if args.archive:
+        return make_archive(args, records, settings)
+
+    saved_dir = Path(args.out)
+    saved_dir.mkdir(parents=True, exist_ok=True)
+
+    count = failed = skipped = 0
+    start = time.perf_counter()
+    try:
+        manifest = BatchManifest(saved_dir, settings)
+        if args.no_resume:
+            manifest.forget()
+        jobs = iter_batch_jobs(records, saved_dir, settings)
+        report = VerifyReport(verify_report_path(args, saved_dir))
+        memory = MemoryReport(memory_report_path(args, saved_dir))
+        with manifest, report, memory:
+            for r in iter_batch_results(jobs, settings, args.workers, args.chunk_size, manifest):
+                report.add(r)
+                memory.add(r)
+                if r.skipped:
+                    skipped += 1
+                elif r.error:
+                    failed += 1
+                    print(f"error: row {r.index} ({r.url}): {r.error}", file=sys.stderr)
+                else:
+                    count += 1
+                    if r.note:
+                        print(f"warning: row {r.index} ({r.url}): {r.note}", file=sys.stderr)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"{count} QR codes saved to {saved_dir} in {elapsed:.2f}s ({rate:.1f} stickers/sec)")
+    report_timings(args, count, elapsed)
+    if skipped:
+        print(f"{skipped} already done in an earlier run (skipped)")
+    print_verify_summary(report)
+    print_memory_summary(memory)
+    if failed:
+        print(f"{failed} item(s) failed", file=sys.stderr)
+    return 1 if failed or report.failed else 0
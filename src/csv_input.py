@@ -0,0 +1,79 @@
+# src/csv_input.py
+# Streaming CSV input for batches: records are parsed and yielded one row at a time,
+# so memory use does not grow with the number of rows and rendering can start on row 1.
+
+import csv
+from collections import namedtuple
+
+
+class BatchRecord(namedtuple("BatchRecord", ["index", "base_url", "suffix", "label"])):
+    """One batch item: index counts from 1, label is None unless a label column was selected."""
+    __slots__ = ()
+
+    @property
+    def url(self) -> str:
+        return self.base_url + self.suffix
+
+
+def _resolve_column(column, header, what: str) -> int:
+    """Turns a column name (needs a header) or a 0-based index into an index."""
+    if column is None:
+        return None
+    if isinstance(column, int):
+        return column
+    if str(column).isdigit():
+        return int(column)
+    if header is None:
+        raise ValueError(f"{what} column '{column}' given by name, but the CSV has no header row")
+    try:
+        return header.index(column)
+    except ValueError:
+        raise ValueError(f"{what} column '{column}' not found in CSV header: {', '.join(header)}") from None
+
+
+def iter_rows(csv_path, delimiter: str = ",", encoding: str = "utf-8-sig"):
+    """Yields (line_number, cells) for each non-empty CSV row, with cells stripped."""
+    with open(csv_path, "r", encoding=encoding, newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        for row in reader:
+            cells = [cell.strip() for cell in row]
+            if any(cells):
+                yield reader.line_num, cells
+
+
+def iter_csv_records(csv_path, base_url=None, column=0, label_column=None, header: bool = False,
+                     delimiter: str = ",", encoding: str = "utf-8-sig"):
+    """
+    Lazily yields a BatchRecord per data row of a batch CSV.
+
+    By default this reads the app's original format: the first row is the base URL and
+    each following row's first cell is a suffix added to it. With base_url given
+    (use "" for a column of full URLs) every row is data. header=True skips a header
+    row and lets column/label_column be given by name as well as by 0-based index.
+    """
+    rows = iter_rows(csv_path, delimiter, encoding)
+
+    header_cells = None
+    if header:
+        header_cells = next(rows, (0, None))[1]
+    column = _resolve_column(column, header_cells, "URL")
+    label_column = _resolve_column(label_column, header_cells, "Label")
+
+    if base_url is None:
+        first = next(rows, None)
+        if first is None:
+            return
+        base_url = first[1][0]
+
+    index = 0
+    for line_number, cells in rows:
+        if column >= len(cells):
+            raise ValueError(f"CSV line {line_number}: no column {column} in {cells}")
+        suffix = cells[column]
+        if not suffix:
+            continue
+        label = None
+        if label_column is not None and label_column < len(cells):
+            label = cells[label_column] or None
+        index += 1
+        yield BatchRecord(index, base_url, suffix, label)
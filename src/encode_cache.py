@@ -0,0 +1,171 @@
+# src/encode_cache.py
+# Module-matrix cache shared by every renderer: QR encoding (including the mask pattern
+# search) runs once per (data, version, error level, border). An in-memory LRU sits in
+# front of an optional SQLite store, so a batch re-rendered in another layout or DPI,
+# even in a later run, skips encoding entirely.
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Environment variable naming an on-disk store, e.g. QR_STICKER_ENCODE_CACHE=~/.cache/qr-encodes.sqlite
+ENCODE_CACHE_ENV_VAR = "QR_STICKER_ENCODE_CACHE"
+
+DEFAULT_MAX_ENTRIES = 4096
+
+# SQLite connections a forked process inherited from its parent, kept alive unused
+_inherited_stores = []
+
+
+class EncodeCache:
+    """
+    LRU of encoded matrices, optionally backed by a SQLite file. Matrices are stored as
+    tuples of bytes rows (1 = dark module), which are immutable and can be shared freely.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self.path = None
+        self.enabled = True
+        if path:
+            self.open_store(path)
+
+    def open_store(self, path):
+        """
+        Backs the cache with a SQLite file (created if missing). Safe to share between processes.
+        The connection is opened on first use, separately in every process.
+        """
+        self.close_store()
+        self.path = os.path.expanduser(str(path))
+
+    def close_store(self):
+        if self._db is not None and self._db_pid != os.getpid():
+            _inherited_stores.append(self._db)  # see _store()
+        elif self._db is not None:
+            self._db.close()
+        self._db = None
+        self.path = None
+
+    def _store(self):
+        """The SQLite connection for this process, or None without a store. Call with the lock held."""
+        if self.path is None:
+            return None
+        if self._db is not None and self._db_pid != os.getpid():
+            # Inherited over fork: SQLite connections must not be used or closed in the child,
+            # and garbage collection would close it, so keep it referenced but untouched
+            _inherited_stores.append(self._db)
+            self._db = None
+        if self._db is None:
+            import sqlite3  # only needed with an on-disk store
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS encodes ("
+                " data TEXT, version INTEGER, error_level TEXT, border INTEGER,"
+                " actual_version INTEGER, size INTEGER, modules BLOB,"
+                " PRIMARY KEY (data, version, error_level, border))"
+            )
+            db.commit()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def get(self, key):
+        """Returns (matrix, actual_version) for key = (data, version, error_level, border), or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            db = self._store()
+            if db is not None:
+                row = db.execute(
+                    "SELECT actual_version, size, modules FROM encodes"
+                    " WHERE data = ? AND version = ? AND error_level = ? AND border = ?", key
+                ).fetchone()
+                if row is not None:
+                    entry = (_unpack_matrix(row[1], row[2]), row[0])
+                    self._remember(key, entry)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, matrix, actual_version: int):
+        """Stores a freshly encoded matrix and returns it in the cached (bytes rows) form."""
+        matrix = tuple(bytes(1 if dark else 0 for dark in row) for row in matrix)
+        entry = (matrix, actual_version)
+        if not self.enabled:
+            return entry
+        with self._lock:
+            self._remember(key, entry)
+            db = self._store()
+            if db is not None:
+                db.execute(
+                    "INSERT OR IGNORE INTO encodes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (*key, actual_version, len(matrix), _pack_matrix(matrix))
+                )
+                db.commit()
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    @contextmanager
+    def disabled(self):
+        """Makes every lookup a miss and stores nothing inside the block (for benchmarks)."""
+        was_enabled = self.enabled
+        self.enabled = False
+        try:
+            yield self
+        finally:
+            self.enabled = was_enabled
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _pack_matrix(matrix) -> bytes:
+    """Packs bytes rows of 0/1 into a bit string, 8 modules per byte."""
+    bits = b"".join(matrix)
+    packed = bytearray((len(bits) + 7) // 8)
+    for i, dark in enumerate(bits):
+        if dark:
+            packed[i >> 3] |= 0x80 >> (i & 7)
+    return bytes(packed)
+
+
+def _unpack_matrix(size: int, packed: bytes):
+    bits = bytes((packed[i >> 3] >> (7 - (i & 7))) & 1 for i in range(size * size))
+    return tuple(bits[row * size:(row + 1) * size] for row in range(size))
+
+
+# The process-wide cache used by generator.encode_qr (its store is only opened when first used)
+_cache = EncodeCache(path=os.environ.get(ENCODE_CACHE_ENV_VAR) or None)
+
+
+def get_encode_cache() -> EncodeCache:
+    return _cache
+
+
+def set_encode_cache_path(path):
+    """Backs the shared cache with a SQLite file, or with nothing if path is None."""
+    if path:
+        if _cache.path != os.path.expanduser(str(path)):
+            _cache.open_store(path)
+    else:
+        _cache.close_store()
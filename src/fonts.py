@@ -0,0 +1,111 @@
+# src/fonts.py
+# Font loading and caption fitting shared by all sticker generators
+
+import os
+from functools import lru_cache
+from PIL import ImageFont
+from .timing import stage
+
+# Environment variable that overrides the caption font, e.g. QR_STICKER_FONT=/usr/share/fonts/.../DejaVuSans.ttf
+FONT_ENV_VAR = "QR_STICKER_FONT"
+
+# Tried in order when no font is configured. "arial.ttf" is what the app has
+# always used on Windows; the others cover typical macOS/Linux installs.
+DEFAULT_FONT_CANDIDATES = [
+    "arial.ttf",
+    "Arial.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "LiberationSans-Regular.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+]
+
+MAX_CACHED_FONTS = 256
+
+_configured_font_path = None
+
+
+def set_font_path(path):
+    """Sets the caption font used when a generator is not given one (None = auto-detect)."""
+    global _configured_font_path
+    _configured_font_path = str(path) if path else None
+    resolve_font_path.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def _find_default_font():
+    for candidate in DEFAULT_FONT_CANDIDATES:
+        try:
+            ImageFont.truetype(candidate, 10)
+            return candidate
+        except OSError:
+            continue
+    return None  # nothing found: Pillow's built-in font
+
+
+@lru_cache(maxsize=None)
+def resolve_font_path(font_path=None):
+    """
+    Returns the font file to use: the given path, else set_font_path(), else
+    $QR_STICKER_FONT, else the first loadable DEFAULT_FONT_CANDIDATES entry.
+    None means Pillow's built-in default font.
+    """
+    path = font_path or _configured_font_path or os.environ.get(FONT_ENV_VAR)
+    if path:
+        # Fail loudly on an explicitly configured font that cannot be loaded
+        ImageFont.truetype(path, 10)
+        return path
+    return _find_default_font()
+
+
+@lru_cache(maxsize=MAX_CACHED_FONTS)
+def get_font(font_path, size: int):
+    """Returns a loaded font for (path, size), keeping the most recently used ones in memory."""
+    if font_path is None:
+        try:
+            return ImageFont.load_default(size)
+        except ImportError:
+            # Pillow built without FreeType: the bitmap default font cannot be resized
+            return ImageFont.load_default()
+    return ImageFont.truetype(font_path, size)
+
+
+def fit_font(text: str, max_width: int, max_size: int, min_size: int, font_path=None):
+    """
+    Finds the largest font size in [min_size, max_size] whose rendering of text
+    is at most max_width pixels wide. Falls back to min_size if nothing fits.
+    Returns (font, bbox) where bbox is the text bounding box at (0, 0).
+    """
+    with stage("font_fit"):
+        return _fit_font(text, max_width, max_size, min_size, font_path)
+
+
+def _fit_font(text: str, max_width: int, max_size: int, min_size: int, font_path=None):
+    font_path = resolve_font_path(font_path)
+    max_size = max(max_size, min_size)
+
+    # Start from a width-scaled estimate and binary search around it
+    low, high = min_size, max_size
+    best = min_size
+    guess = max_size
+    while low <= high:
+        font = get_font(font_path, guess)
+        bbox = font.getbbox(text)
+        width = bbox[2] - bbox[0]
+        if width <= max_width:
+            best = guess
+            low = guess + 1
+        else:
+            high = guess - 1
+        if low > high:
+            break
+        if width > 0 and low <= guess * max_width // width <= high:
+            guess = guess * max_width // width
+        else:
+            guess = (low + high + 1) // 2
+
+    font = get_font(font_path, best)
+    return font, font.getbbox(text)
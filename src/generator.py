@@ -1,104 +1,191 @@
-from PIL import Image, ImageDraw, ImageFont
-import qrcode
-import qrcode.image.svg
-from qrcode.constants import ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q, ERROR_CORRECT_H
+import warnings
+from PIL import Image, ImageDraw
 from pathlib import Path
+from .fonts import fit_font
+from .svg_sticker import build_svg_sticker
+from .layout import TagLayout, default_zones, load_layout, read_layout
+from .timing import stage
+from .encode_cache import get_encode_cache
 
-# Map string to constant
+_encode_cache = get_encode_cache()
+
+# Map string to qrcode.constants.ERROR_CORRECT_* (values inlined so importing this module
+# does not load qrcode; it is only imported when something actually has to be encoded)
 ERROR_CORRECTION_MAP = {
-    "L": ERROR_CORRECT_L,
-    "M": ERROR_CORRECT_M,
-    "Q": ERROR_CORRECT_Q,
-    "H": ERROR_CORRECT_H,
+    "L": 1,  # ERROR_CORRECT_L
+    "M": 0,  # ERROR_CORRECT_M
+    "Q": 3,  # ERROR_CORRECT_Q
+    "H": 2,  # ERROR_CORRECT_H
 }
 
-def create_luggage_tag_qr_image(url: str, version: int = 4, error_level: str = 'M', filename="tag_output.png", template_path=None, qr_zone=(0, 0, 827, 472)):
+
+def encode_qr(url: str, version: int = 4, error_level: str = 'M', border: int = 1):
     """
-    Generates a QR code and URL image composited onto a tag template background.
-    The tag template is assumed to be 2598x472px, and the QR zone is 827x472px at (0,0).
+    Encodes url and returns (matrix, actual_version). The matrix is a sequence of rows
+    (truthy = dark module) including a quiet zone of `border` modules.
+    The version is increased automatically if the data does not fit.
+    Results come from the shared encode cache when the same data was encoded before.
     """
-    # Load the background template
-    if template_path is None:
-        BASE_DIR = Path(__file__).resolve().parent.parent
-        template_path = BASE_DIR / "assets" / "tag_template.png"
-    
-    TEMPLATE_PATH = Path(template_path)
-    
-    if not TEMPLATE_PATH.exists():
-        raise FileNotFoundError(f"Template image not found at {TEMPLATE_PATH}")
-    
-    background = Image.open(TEMPLATE_PATH).convert("RGBA")
-    # Unpack the QR zone
-    zone_x, zone_y, qr_zone_width, qr_zone_height = qr_zone
-
-    # Make the QR code image with text below (on a transparent canvas)
-    qr_size = int(qr_zone_height * 0.75)  # ~75% of vertical space
-    qr_img = qrcode.QRCode(
-        version=version,
-        error_correction=ERROR_CORRECTION_MAP.get(error_level.upper(), ERROR_CORRECT_M),
-        box_size=10,
-        border=1
-    )
-    qr_img.add_data(url)
-    qr_img.make(fit=True)
+    with stage("encode"):
+        key = (url, version, error_level.upper(), border)
+        cached = _encode_cache.get(key)
+        if cached is not None:
+            return cached
 
-    # warn if version number different to user selection
-    actual_version = qr_img.version
-    if actual_version != version:
-        from tkinter import messagebox
-        messagebox.showinfo(
-            "Version Adjusted",
-            f"The selected QR version ({version}) was too small to fit {len(url)} chars.\n"
-            f"It has been increased to version {actual_version} to fit your data."
+        import qrcode  # cache misses only
+        qr = qrcode.QRCode(
+            version=version,
+            error_correction=ERROR_CORRECTION_MAP.get(error_level.upper(), ERROR_CORRECTION_MAP["M"]),
+            border=border
         )
+        # One segment (no mixed-mode optimisation), so qr_info.min_version() is exact
+        qr.add_data(url, optimize=0)
+        qr.make(fit=True)
+        return _encode_cache.put(key, qr.get_matrix(), qr.version)
+
+
+def render_qr_modules(matrix, target_px: int) -> Image.Image:
+    """
+    Paints a module matrix as a greyscale ("L") image using the largest whole number of
+    pixels per module that fits in target_px, so module edges stay sharp (no resampling blur).
+    The returned image is (modules * scale) px square, which can be a little under target_px.
+    """
+    with stage("resize"):
+        modules = len(matrix)
+        scale = max(1, target_px // modules)
+        pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+        qr_img = Image.frombytes("L", (modules, modules), pixels)
+        # NEAREST with an integer factor just repeats each module scale x scale times
+        return qr_img.resize((modules * scale, modules * scale), Image.Resampling.NEAREST)
+
+
+DEFAULT_TEMPLATE_PATH = Path(__file__).resolve().parent.parent / "assets" / "tag_template.png"
+
+# Decoded RGBA templates keyed on (resolved path, mtime)
+_template_cache = {}
+
+
+def _get_cached_template(template_path=None) -> Image.Image:
+    return _cached_template(template_path)[1]
+
+
+def _cached_template(template_path=None):
+    """(cache key, decoded template); the key is (resolved path, mtime) and changes with the file."""
+    template_path = Path(template_path) if template_path is not None else DEFAULT_TEMPLATE_PATH
+    if not template_path.exists():
+        raise FileNotFoundError(f"Template image not found at {template_path}")
+
+    resolved = template_path.resolve()
+    key = (resolved, template_path.stat().st_mtime_ns)
+    template = _template_cache.get(key)
+    if template is None:
+        # Drop any stale decode of an older version of the same file
+        for stale_key in [k for k in _template_cache if k[0] == resolved]:
+            del _template_cache[stale_key]
+        with Image.open(resolved) as src:
+            template = src.convert("RGBA")
+        _template_cache[key] = template
+    return key, template
+
 
-    qr_rendered = qr_img.make_image(fill_color="black", back_color="white").convert("RGBA")
-    qr_rendered = qr_rendered.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
+def load_template(template_path=None) -> Image.Image:
+    """
+    Returns a fresh RGBA copy of the tag template (default: assets/tag_template.png).
+    The file is only decoded again when its path or modification time changes.
+    """
+    with stage("template"):
+        return _get_cached_template(template_path).copy()
 
-    # Prepare a transparent image for the QR zone
-    qr_zone_img = Image.new("RGBA", (qr_zone_width, qr_zone_height), (255, 255, 255, 0))
-    draw = ImageDraw.Draw(qr_zone_img)
 
-    # Paste QR code in middle
-    qr_x = (qr_zone_width - qr_size) // 2
-    qr_y = (qr_zone_height - qr_size) // 2
-    qr_zone_img.paste(qr_rendered, (qr_x, qr_y))
+def preload_templates(*template_paths):
+    """Decodes the given templates into the cache, e.g. once per batch worker process."""
+    for template_path in template_paths or (None,):
+        _get_cached_template(template_path)
 
-    # Prepare URL text
-    padding = int(qr_zone_width * 0.05)
-    max_text_width = qr_zone_width - 2 * padding
-    text = url if len(url) <= 80 else url[:77] + "..."
-    font_size = 28
 
-    while font_size > 5:
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-            break
-        bbox = draw.textbbox((0, 0), text, font=font)
-        # get text width in pixels of this iteration
-        text_width = bbox[2] - bbox[0]
-        if text_width <= max_text_width:
-            break
-        font_size -= 1
+def clear_template_cache():
+    _template_cache.clear()
+    _layout_cache.clear()
 
-    text_x = (qr_zone_width - text_width) // 2
 
-    # calculate text height
-    text_height = bbox[3] - bbox[1]
-    remaining_space = qr_zone_height - qr_size
-    text_y = qr_size + (remaining_space//2)
+def create_luggage_tag_qr_image(url: str, version: int = 4, error_level: str = 'M', filename="tag_output.png", template_path=None, qr_zone=(0, 0, 827, 472), on_version_adjusted=None, font_path=None, caption=None, png_options=None):
+    """
+    Generates a QR code and URL image composited onto a tag template background.
+    The tag template is assumed to be 2598x472px, and the QR zone is 827x472px at (0,0).
+    If the QR version had to be increased, on_version_adjusted(requested, actual, url)
+    is called; without a callback a warning is issued (the GUI passes a message box).
+    font_path selects the caption font (default: see fonts.resolve_font_path) and
+    caption replaces the URL as the text under the QR code. png_options: see writer.save_png.
+    """
+    from .sticker import StickerSpec, render_to  # the library API is built on this module
+    spec = StickerSpec("luggage", version, error_level, font_path, template_path=template_path, qr_zone=qr_zone,
+                       **_png_fields(png_options))
+    render_to(url, spec, filename, caption, on_version_adjusted)
 
-    draw.text((text_x, text_y), text, fill="black", font=font)
 
-    # Paste QR zone onto background at specified position
-    background.paste(qr_zone_img, (zone_x, zone_y), qr_zone_img)
+def _png_fields(png_options) -> dict:
+    """writer.save_png options as sticker.StickerSpec fields."""
+    return {f"png_{key}": value for key, value in (png_options or {}).items()}
 
-    background.save(filename)
 
+def render_luggage_tag_qr_image(url: str, version: int = 4, error_level: str = 'M', template_path=None, qr_zone=(0, 0, 827, 472), on_version_adjusted=None, font_path=None, caption=None, layout_path=None) -> Image.Image:
+    """
+    Draws the luggage tag (see create_luggage_tag_qr_image) in memory and returns it
+    as an RGBA image the size of the template. With layout_path, the zones come from
+    that layout file (see layout.py) and template_path/qr_zone are not used.
+    """
+    layout = get_tag_layout(template_path, qr_zone, font_path, layout_path)
+    matrix, actual_version = encode_qr(url, version, error_level)
+
+    # warn if version number different to user selection
+    if actual_version != version and on_version_adjusted is not None:
+        on_version_adjusted(version, actual_version, url)
+    elif actual_version != version:
+        warnings.warn(f"QR version {version} is too small for {len(url)} chars, used version {actual_version}", stacklevel=2)
+
+    qr_rendered = render_qr_modules(matrix, layout.qr_px())
+    return layout.render(qr_rendered, url, caption)
 
-def create_rectangle_qr_image_2(url: str, width_mm: float, height_mm: float, dpi: int = 300, version: int = 4, error_level: str = 'M', filename="qr_output.png", output_svg=False, include_url_text=True):
+
+# Tag layouts with their pre-rendered static base, keyed on what they were built from
+_layout_cache = {}
+
+
+def get_tag_layout(template_path=None, qr_zone=(0, 0, 827, 472), font_path=None, layout_path=None) -> TagLayout:
+    """
+    Returns the TagLayout for a layout file, or the classic single QR zone layout on a
+    template. Built once per process and rebuilt when the layout or template file changes.
+    """
+    with stage("template"):
+        if layout_path is not None:
+            layout_file = Path(layout_path).resolve()
+            layout_mtime = layout_file.stat().st_mtime_ns
+            entry = _layout_cache.get(("file", layout_file, font_path))
+            if entry is not None and entry[0] == layout_mtime:
+                template_file = entry[1]
+            else:
+                template_file = read_layout(layout_file)["template"]
+            template_key, template = _cached_template(template_file)
+            key = ("file", layout_file, font_path)
+            stamp = (layout_mtime, template_file, template_key)
+        else:
+            template_key, template = _cached_template(template_path)
+            key = ("zone", tuple(qr_zone), font_path)
+            # Same (path, mtime) key as the template cache: rebuilt whenever the file changes
+            stamp = (None, template_path, template_key)
+
+        entry = _layout_cache.get(key)
+        if entry is None or entry[:3] != stamp:
+            if layout_path is not None:
+                layout = load_layout(layout_file, font_path, template)
+            else:
+                layout = TagLayout(template, default_zones(qr_zone), font_path=font_path)
+            entry = (*stamp, layout)
+            _layout_cache[key] = entry
+        return entry[3]
+
+
+def create_rectangle_qr_image_2(url: str, width_mm: float, height_mm: float, dpi: int = 300, version: int = 4, error_level: str = 'M', filename="qr_output.png", output_svg=False, include_url_text=True, font_path=None, caption=None):
     """
     Generates an rectangular image of QR code with URL text underneath of a given size at a DPI of 300
     """
@@ -109,144 +196,130 @@ def create_rectangle_qr_image_2(url: str, width_mm: float, height_mm: float, dpi
     # QR code size = ~80% of vertical space
     qr_height = int(height_px * 0.75)
 
-    if output_svg:
-        factory = qrcode.image.svg.SvgImage
-    else:
-        factory = None
-    
-    qr = qrcode.QRCode(
-        version=version,
-        error_correction=ERROR_CORRECTION_MAP.get(error_level.upper(), ERROR_CORRECT_M),
-        box_size=10,
-        border=1,
-        image_factory=factory
-    )
-
-    qr.add_data(url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-    qr_img = qr_img.resize((qr_height, qr_height), Image.Resampling.LANCZOS)
-
-    img = Image.new("RGB", (width_px, height_px), "white")
-    draw = ImageDraw.Draw(img)
-
-    # Center QR
-    qr_x = (width_px - qr_height) // 2
-    img.paste(qr_img, (qr_x, 10))
+    matrix, _ = encode_qr(url, version, error_level)
+    qr_img = render_qr_modules(matrix, qr_height)
+    # Keep the QR centred in its qr_height box
+    qr_offset = (qr_height - qr_img.width) // 2
 
     # Draw text below QR
     padding = int(width_px * 0.06)  # 5% padding left and right
     max_text_width = width_px - 2 * padding
 
-    text = url if len(url) <= 80 else url[:77] + "..."
-
-    # Try decreasing font size until it fits
-    font_size = int(dpi / 3)  # start around 25pt at 300 DPI
-    while font_size > 6:
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-            break  # Can't resize default font
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        if text_width <= max_text_width:
-            break
-        font_size -= 1
-
-    # Centered text position
-    text_x = (width_px - text_width) // 2
-    text_y = qr_height + 20
-    draw.text((text_x, text_y), text, fill="black", font=font)
-
-    if output_svg:
-        img.save(filename)
-    else:
-        img.save(filename, dpi=(dpi, dpi))
+    text = caption or url
+    text = text if len(text) <= 80 else text[:77] + "..."
 
-def create_rectangle_qr_image(
+    # Largest font size (up to ~25pt at 300 DPI) that fits the width
+    font, bbox = fit_font(text, max_text_width, int(dpi / 3), 7, font_path)
+    text_width = bbox[2] - bbox[0]
+
+    with stage("composite"):
+        img = Image.new("RGB", (width_px, height_px), "white")
+        draw = ImageDraw.Draw(img)
+
+        # Center QR
+        qr_x = (width_px - qr_img.width) // 2
+        img.paste(qr_img, (qr_x, 10 + qr_offset))
+
+        # Centered text position
+        text_x = (width_px - text_width) // 2
+        text_y = qr_height + 20
+        draw.text((text_x, text_y), text, fill="black", font=font)
+
+    with stage("save"):
+        if output_svg:
+            img.save(filename)
+        else:
+            img.save(filename, dpi=(dpi, dpi))
+
+def render_rectangle_qr_image(
     url: str,
     width_mm: float,
     height_mm: float,
     dpi: int = 300,
     version: int = 4,
     error_level: str = 'M',
-    filename="qr_output.png",
-    output_svg=False,
-    include_url_text=True
-):
+    include_url_text=True,
+    font_path=None,
+    caption=None
+) -> Image.Image:
     """
-    Generates a rectangular image of a QR code with optional URL text underneath.
-    Output is a PNG (bitmap) or SVG (vector) depending on output_svg flag.
+    Draws the rectangular PNG sticker (QR code with optional URL text underneath)
+    in memory and returns it as an RGB image of width_mm x height_mm at dpi.
     """
+    width_px, height_px, qr_height = rect_sticker_size(width_mm, height_mm, dpi)
 
-    if output_svg:
-        # --- SVG MODE ---
-        factory = qrcode.image.svg.SvgImage
-        qr = qrcode.QRCode(
-            version=version,
-            error_correction=ERROR_CORRECTION_MAP.get(error_level.upper(), ERROR_CORRECT_M),
-            box_size=100,
-            border=1,
-            image_factory=factory
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
-        img = qr.make_image()
-        img.save(filename)
-        return  # Done!
+    # Paint the modules straight at a whole number of pixels per module
+    matrix, _ = encode_qr(url, version, error_level)
+    qr_img = render_qr_modules(matrix, qr_height)
+
+    # Optional: fit the URL text first so all drawing happens in one pass
+    fitted = fit_rect_caption(caption or url, width_px, qr_height, dpi, font_path) if include_url_text else None
+    return compose_rect_sticker(width_px, height_px, qr_height, qr_img, fitted)
+
+
+def compose_rect_sticker(width_px: int, height_px: int, qr_height: int, qr_img: Image.Image, caption=None) -> Image.Image:
+    """Places a rendered QR (and caption, as returned by fit_rect_caption) on a white RGB sticker."""
+    with stage("composite"):
+        img = Image.new("RGB", (width_px, height_px), "white")
+        img.paste(qr_img, rect_qr_position(width_px, height_px, qr_height, qr_img.width, caption is not None))
+        if caption is not None:
+            text, font, position = caption
+            ImageDraw.Draw(img).text(position, text, fill="black", font=font)
+    return img
 
-    # --- PNG MODE (Pillow drawing) ---
+
+def rect_sticker_size(width_mm: float, height_mm: float, dpi: int):
+    """(width_px, height_px, qr_height) of a rectangular sticker; the QR box is 75% of the height."""
     width_px = int((width_mm / 25.4) * dpi)
     height_px = int((height_mm / 25.4) * dpi)
-    qr_height = int(height_px * 0.75)
+    return width_px, height_px, int(height_px * 0.75)
+
 
-    qr = qrcode.QRCode(
-        version=version,
-        error_correction=ERROR_CORRECTION_MAP.get(error_level.upper(), ERROR_CORRECT_M),
-        box_size=10,
-        border=1
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-    qr_img = qr_img.resize((qr_height, qr_height), Image.Resampling.LANCZOS)
-
-    img = Image.new("RGB", (width_px, height_px), "white")
-    draw = ImageDraw.Draw(img)
-
-    # Optional: Draw URL text
+def rect_qr_position(width_px: int, height_px: int, qr_height: int, qr_px: int, include_url_text: bool):
+    """Top-left corner of a qr_px QR image on a rectangular sticker."""
+    qr_x = (width_px - qr_px) // 2
     if include_url_text:
-        # Center QR in x and leave space for URL in y
-        qr_x = (width_px - qr_height) // 2
-        img.paste(qr_img, (qr_x, 20))
-
-        padding = int(width_px * 0.05)
-        max_text_width = width_px - 2 * padding
-        text = url if len(url) <= 80 else url[:77] + "..."
-
-        # Try decreasing font size until it fits
-        font_size = int(dpi / 3) # start around 25pt at 300 DPI
-        while font_size > 6:
-            try:
-                font = ImageFont.truetype("arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-                break
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            if text_width <= max_text_width:
-                break
-            font_size -= 1
+        # Centred in the qr_height box at the top, leaving space for the URL below
+        return qr_x, 20 + (qr_height - qr_px) // 2
+    return qr_x, (height_px - qr_px) // 2
 
-        text_x = (width_px - text_width) // 2
-        text_y = qr_height + 20
-        draw.text((text_x, text_y), text, fill="black", font=font)
-    else:
-        # Center QR in x and y
-        qr_x = (width_px - qr_height) // 2
-        qr_y = (height_px - qr_height) // 2
-        img.paste(qr_img, (qr_x, qr_y))
-
-    # Save final PNG
-    img.save(filename, dpi=(dpi, dpi))
+
+def fit_rect_caption(text: str, width_px: int, qr_height: int, dpi: int, font_path=None):
+    """Shortens and fits the caption under the QR code; returns (text, font, (x, y))."""
+    text = text if len(text) <= 80 else text[:77] + "..."
+    # Largest font size (up to ~25pt at 300 DPI) that fits the width minus 5% padding per side
+    padding = int(width_px * 0.05)
+    font, bbox = fit_font(text, width_px - 2 * padding, int(dpi / 3), 7, font_path)
+    return text, font, ((width_px - (bbox[2] - bbox[0])) // 2, qr_height + 20)
+
+
+def render_rectangle_qr_svg(url: str, width_mm: float, height_mm: float, version: int = 4, error_level: str = 'M', include_url_text=True, caption=None) -> str:
+    """Returns the SVG document for a rectangular sticker (see create_rectangle_qr_image)."""
+    matrix, _ = encode_qr(url, version, error_level)
+    with stage("composite"):
+        return build_svg_sticker(matrix, width_mm, height_mm, (caption or url) if include_url_text else None)
+
+
+def create_rectangle_qr_image(
+    url: str,
+    width_mm: float,
+    height_mm: float,
+    dpi: int = 300,
+    version: int = 4,
+    error_level: str = 'M',
+    filename="qr_output.png",
+    output_svg=False,
+    include_url_text=True,
+    font_path=None,
+    caption=None,
+    png_options=None
+):
+    """
+    Generates a rectangular image of a QR code with optional URL text underneath.
+    Output is a PNG (bitmap) or SVG (vector) depending on output_svg flag.
+    caption, if given, is shown instead of the URL. png_options: see writer.save_png.
+    """
+    from .sticker import StickerSpec, render_to
+    spec = StickerSpec("rect", version, error_level, font_path, width_mm, height_mm, dpi, output_svg, include_url_text,
+                       **_png_fields(png_options))
+    render_to(url, spec, filename, caption)
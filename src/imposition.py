@@ -0,0 +1,142 @@
+# src/imposition.py
+# Packs rectangular stickers onto printable sheets (A4, Letter or label stock) and streams
+# the pages into one multi-page PDF or TIFF. Only the page being filled is kept in memory.
+
+import itertools
+from pathlib import Path
+from PIL import Image, TiffImagePlugin
+from .batch import bulk_images
+from .sticker import StickerSpec, render_image
+
+PAGE_SIZES_MM = {
+    "A4": (210.0, 297.0),
+    "LETTER": (215.9, 279.4),
+}
+
+
+def parse_page_size(page: str):
+    """'A4', 'Letter' or a custom label stock size 'WIDTHxHEIGHT' in mm -> (width_mm, height_mm)."""
+    key = page.strip().upper()
+    if key in PAGE_SIZES_MM:
+        return PAGE_SIZES_MM[key]
+    try:
+        width, height = key.split("X")
+        return float(width), float(height)
+    except ValueError:
+        raise ValueError(f"Unknown page size '{page}' (use A4, Letter or WIDTHxHEIGHT in mm)") from None
+
+
+def grid_positions(page_mm, sticker_mm, margin_mm: float = 10.0, gutter_mm: float = 2.0):
+    """
+    Returns the top-left corner (in mm) of every sticker slot on a page, row by row.
+    The grid is centred inside the margins.
+    """
+    page_w, page_h = page_mm
+    sticker_w, sticker_h = sticker_mm
+    usable_w = page_w - 2 * margin_mm
+    usable_h = page_h - 2 * margin_mm
+    cols = int((usable_w + gutter_mm) // (sticker_w + gutter_mm))
+    rows = int((usable_h + gutter_mm) // (sticker_h + gutter_mm))
+    if cols < 1 or rows < 1:
+        raise ValueError(f"A {sticker_w}x{sticker_h}mm sticker does not fit on a {page_w}x{page_h}mm page with {margin_mm}mm margins")
+
+    grid_w = cols * sticker_w + (cols - 1) * gutter_mm
+    grid_h = rows * sticker_h + (rows - 1) * gutter_mm
+    left = (page_w - grid_w) / 2
+    top = (page_h - grid_h) / 2
+    return [
+        (left + col * (sticker_w + gutter_mm), top + row * (sticker_h + gutter_mm))
+        for row in range(rows)
+        for col in range(cols)
+    ]
+
+
+class SheetWriter:
+    """Appends pages one at a time to a multi-page PDF or TIFF (chosen by file extension)."""
+
+    def __init__(self, path, dpi: int):
+        self.path = Path(path)
+        self.dpi = dpi
+        self.pages = 0
+        self.format = {".pdf": "PDF", ".tif": "TIFF", ".tiff": "TIFF"}.get(self.path.suffix.lower())
+        if self.format is None:
+            raise ValueError(f"Sheet output must be .pdf, .tif or .tiff, not '{self.path.suffix}'")
+        self._tiff = None
+
+    def add_page(self, page: Image.Image):
+        # Bilevel pages: lossless CCITT G4 in both formats (Pillow would JPEG-compress greyscale PDF pages)
+        page = page.convert("1", dither=Image.Dither.NONE)
+        if self.format == "PDF":
+            # Pillow appends a PDF page as an incremental update, so earlier pages stay on disk only
+            page.save(self.path, "PDF", resolution=self.dpi, append=self.pages > 0)
+        else:
+            if self._tiff is None:
+                self._tiff = TiffImagePlugin.AppendingTiffWriter(str(self.path), True)
+            page.save(self._tiff, "TIFF", dpi=(self.dpi, self.dpi), compression="group4")
+            self._tiff.newFrame()
+        self.pages += 1
+
+    def close(self):
+        if self._tiff is not None:
+            self._tiff.close()
+            self._tiff = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def impose_stickers(stickers, sheet_path, dpi: int, sticker_mm, page="A4", margin_mm: float = 10.0, gutter_mm: float = 2.0):
+    """
+    Places sticker images (an iterable of width_mm x height_mm images at dpi) onto pages
+    and writes them to sheet_path. Returns (stickers placed, pages written).
+    """
+    page_mm = parse_page_size(page)
+    slots = grid_positions(page_mm, sticker_mm, margin_mm, gutter_mm)
+    page_px = (round(page_mm[0] / 25.4 * dpi), round(page_mm[1] / 25.4 * dpi))
+
+    placed = 0
+    page_img = None
+    with SheetWriter(sheet_path, dpi) as writer:
+        for sticker in stickers:
+            slot = placed % len(slots)
+            if slot == 0:
+                if page_img is not None:
+                    writer.add_page(page_img)
+                # Stickers are black on white, so a greyscale page is enough
+                page_img = Image.new("L", page_px, 255)
+            x_mm, y_mm = slots[slot]
+            page_img.paste(sticker, (round(x_mm / 25.4 * dpi), round(y_mm / 25.4 * dpi)))
+            placed += 1
+        if page_img is not None:
+            writer.add_page(page_img)
+        pages = writer.pages
+    return placed, pages
+
+
+def iter_sheet_stickers(jobs, settings: dict, on_error=None):
+    """
+    Renders rectangular stickers in memory for batch.BatchJobs. Items that fail are
+    passed to on_error(job, exception) and left off the sheet.
+    """
+    spec = StickerSpec.from_settings(settings)
+    jobs, rendering = itertools.tee(jobs)  # bulk rendering reads a chunk ahead of the results
+    images = bulk_images(rendering, spec, settings)
+    if images is None:
+        images = (_render_one(job, spec) for job in rendering)
+    for job, (img, error) in zip(jobs, images):
+        if error is None:
+            yield img
+        elif on_error is None:
+            raise error
+        else:
+            on_error(job, error)
+
+
+def _render_one(job, spec: StickerSpec):
+    try:
+        return render_image(job.url, spec, job.label), None
+    except Exception as e:
+        return None, e
@@ -0,0 +1,491 @@
+# src/job_server.py
+# Local render service: python -m src.main serve [--port 8765] [--workers N] [--data-dir DIR]
+# Takes CSV batches over HTTP, queues them in a SQLite table and renders them one after
+# another on one pool of long-lived worker processes, so the template, layout, font and
+# encode caches stay warm from job to job. Every job becomes one archive (see archive.py).
+#
+#   POST   /jobs                CSV body, settings in the query string:
+#                                 curl --data-binary @devices.csv "http://127.0.0.1:8765/jobs?mode=luggage&version=5"
+#                               or a JSON body {"csv": "...", "settings": {...}, "csv_options": {...}, "archive": ".zip"}
+#   GET    /jobs                recent jobs, newest first
+#   GET    /jobs/<id>           status and progress
+#   GET    /jobs/<id>/archive   the finished archive
+#   DELETE /jobs/<id>           cancel (a running job stops after the chunks in flight)
+#
+# Settings are the batch settings keys (batch.DEFAULT_SETTINGS); CSV options are those of
+# csv_input.iter_csv_records. The server listens on 127.0.0.1 and has no authentication.
+
+import argparse
+import json
+import os
+import secrets
+import shutil
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl
+from .archive import ARCHIVE_FORMATS, BatchArchive, archive_format
+from .batch import DEFAULT_SETTINGS, make_settings, iter_batch_jobs, iter_batch_results, init_worker
+from .csv_input import iter_csv_records
+from .generator import preload_templates
+from .precheck import PRECHECK_REPORT_FILENAME, precheck_batch
+from .sticker import StickerSpec
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_DATA_DIR = Path.home() / ".qr-sticker-jobs"
+JOBS_DB_FILENAME = "jobs.sqlite"
+ENCODE_CACHE_FILENAME = "encodes.sqlite"
+
+JOB_STATUSES = ["queued", "running", "done", "failed", "cancelled"]
+
+# Batch settings the server decides, not the client
+SERVER_SETTINGS = ["encode_cache_path", "writer_threads", "timing"]
+CSV_OPTIONS = ["base_url", "column", "label_column", "header", "delimiter"]
+
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+PROGRESS_INTERVAL_S = 0.5  # how often a running job writes its counters
+IDLE_POLL_S = 1.0
+
+ARCHIVE_CONTENT_TYPES = {"zip": "application/zip", "w|": "application/x-tar",
+                         "w|gz": "application/gzip", "w|xz": "application/x-xz"}
+
+
+def _parse_value(key: str, text: str, default):
+    """Turns a query string value into the type of the default it replaces."""
+    if isinstance(default, bool):
+        if text.lower() not in ("1", "0", "true", "false", "yes", "no"):
+            raise ValueError(f"{key} must be true or false")
+        return text.lower() in ("1", "true", "yes")
+    if isinstance(default, tuple):
+        return tuple(int(v) for v in text.split(","))
+    if isinstance(default, (int, float)):
+        try:
+            return type(default)(text)
+        except ValueError:
+            raise ValueError(f"{key} must be a number") from None
+    return text or None
+
+
+def _coerce_setting(key: str, value, default):
+    """Checks a JSON settings value against the type of the default it replaces (strings are parsed as in a query)."""
+    if isinstance(value, str) and not (default is None or isinstance(default, str)):
+        return _parse_value(key, value, default)
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise ValueError(f"{key} must be true or false")
+        return value
+    if isinstance(default, tuple):
+        if not isinstance(value, list) or not all(isinstance(v, int) and not isinstance(v, bool) for v in value):
+            raise ValueError(f"{key} must be a list of whole numbers")
+        return tuple(value)
+    if isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{key} must be a number")
+        if isinstance(default, int) and value != int(value):
+            raise ValueError(f"{key} must be a whole number")
+        return type(default)(value)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{key} must be a string")
+    return value
+
+
+def parse_job_request(body: bytes, content_type: str, query: str):
+    """
+    Reads a POST /jobs request into (csv_text, settings, csv_options, archive suffix).
+    Raises ValueError for anything the batch would reject.
+    """
+    if content_type.split(";")[0].strip() == "application/json":
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON: {e}") from None
+        if not isinstance(payload, dict) or not isinstance(payload.get("csv"), str):
+            raise ValueError("JSON body needs a \"csv\" string")
+        csv_text = payload["csv"]
+        if not isinstance(payload.get("settings") or {}, dict):
+            raise ValueError("\"settings\" must be an object")
+        overrides = {key: _coerce_setting(key, value, DEFAULT_SETTINGS[key]) if key in DEFAULT_SETTINGS else value
+                     for key, value in (payload.get("settings") or {}).items()}
+        csv_options = dict(payload.get("csv_options") or {})
+        suffix = payload.get("archive", ".zip")
+    else:
+        csv_text = body.decode("utf-8-sig")
+        overrides, csv_options, suffix = {}, {}, ".zip"
+        for key, value in parse_qsl(query, keep_blank_values=True):
+            if key == "archive":
+                suffix = value
+            elif key == "header":
+                csv_options[key] = value.lower() in ("1", "true", "yes")
+            elif key == "base_url":
+                csv_options[key] = value  # "" = the rows are full URLs
+            elif key in CSV_OPTIONS:
+                csv_options[key] = value or None
+            elif key in DEFAULT_SETTINGS:
+                overrides[key] = _parse_value(key, value, DEFAULT_SETTINGS[key])
+            else:
+                raise ValueError(f"unknown option '{key}'")
+
+    refused = [key for key in overrides if key in SERVER_SETTINGS]
+    if refused:
+        raise ValueError(f"{', '.join(refused)} cannot be set per job")
+    unknown = [key for key in csv_options if key not in CSV_OPTIONS]
+    if unknown:
+        raise ValueError(f"unknown CSV option(s): {', '.join(unknown)} (use {', '.join(CSV_OPTIONS)})")
+    if suffix not in ARCHIVE_FORMATS:
+        raise ValueError(f"archive must be one of {', '.join(ARCHIVE_FORMATS)}")
+    if not csv_text.strip():
+        raise ValueError("the CSV is empty")
+    settings = make_settings(**overrides)
+    StickerSpec.from_settings(settings)  # validates the values
+    return csv_text, settings, csv_options, suffix
+
+
+class JobQueue:
+    """
+    The job table (SQLite, in the data folder) plus the uploaded CSVs and finished
+    archives next to it. Shared by the HTTP threads and the JobRunner.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir).expanduser()
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.wakeup = threading.Event()  # set when a job is queued
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.data_dir / JOBS_DB_FILENAME), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, started REAL, finished REAL,"
+            " settings TEXT NOT NULL, csv_options TEXT NOT NULL, archive TEXT NOT NULL,"
+            " total INTEGER, rendered INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0,"
+            " skipped INTEGER NOT NULL DEFAULT 0, version INTEGER, notes TEXT, error TEXT,"
+            " cancel INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.commit()
+
+    def csv_path(self, job_id: str) -> Path:
+        return self.data_dir / f"{job_id}.csv"
+
+    def archive_path(self, job: dict) -> Path:
+        return self.data_dir / job["archive"]
+
+    def submit(self, csv_text: str, settings: dict, csv_options: dict, suffix: str = ".zip") -> dict:
+        job_id = secrets.token_hex(6)
+        self.csv_path(job_id).write_text(csv_text, encoding="utf-8")
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, created, settings, csv_options, archive) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, time.time(), json.dumps(settings), json.dumps(csv_options), f"{job_id}{suffix}")
+            )
+            self._db.commit()
+        self.wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, limit: int = 100):
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim(self):
+        """Marks the oldest queued job as running and returns it (None if nothing is queued)."""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', started = ?, rendered = 0, failed = 0, error = NULL WHERE id = ?",
+                (time.time(), row["id"])
+            )
+            self._db.commit()
+        return self.get(row["id"])
+
+    def update(self, job_id: str, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
+
+    def cancel(self, job_id: str):
+        """Cancels a queued job at once and asks a running one to stop; returns the job (None if unknown)."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'", (time.time(), job_id)
+            )
+            self._db.execute("UPDATE jobs SET cancel = 1 WHERE id = ? AND status = 'running'", (job_id,))
+            self._db.commit()
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel"])
+
+    def requeue_running(self) -> int:
+        """Puts jobs left running by a stopped server back in the queue; returns how many."""
+        with self._lock:
+            count = self._db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'"
+            ).rowcount
+            self._db.commit()
+        if count:
+            self.wakeup.set()
+        return count
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _init_server_worker(encode_cache_path):
+    """Pool initializer: the shared encode store plus the bundled template, decoded once per process."""
+    init_worker(make_settings(encode_cache_path=encode_cache_path))
+    preload_templates()
+
+
+class JobRunner(threading.Thread):
+    """
+    Takes queued jobs one at a time and renders each across the whole worker pool.
+    The pool lives as long as the runner, so worker caches carry over between jobs.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int, chunk_size: int = 32, encode_cache_path=None):
+        super().__init__(name="job-runner", daemon=True)
+        self.queue = queue
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.encode_cache_path = encode_cache_path
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Stops after the chunks in flight; a running job stays "running" and is requeued on the next start."""
+        self._stopping.set()
+        self.queue.wakeup.set()
+
+    def run(self):
+        from concurrent.futures import ProcessPoolExecutor
+        while not self._stopping.is_set():
+            # A pool only ends early if a worker process died; start a fresh one then
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_server_worker,
+                                     initargs=(self.encode_cache_path,)) as pool:
+                self._serve(pool)
+
+    def _serve(self, pool):
+        from concurrent.futures.process import BrokenProcessPool
+        while not self._stopping.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self.queue.wakeup.wait(IDLE_POLL_S)
+                self.queue.wakeup.clear()
+                continue
+            try:
+                self.run_job(job, pool)
+            except BrokenProcessPool as e:
+                self.queue.update(job["id"], status="failed", finished=time.time(), error=f"worker process died: {e}")
+                return
+
+    def run_job(self, job: dict, pool):
+        from concurrent.futures.process import BrokenProcessPool
+        job_id = job["id"]
+        settings = json.loads(job["settings"])
+        settings["qr_zone"] = tuple(settings["qr_zone"])
+        settings["encode_cache_path"] = self.encode_cache_path
+        csv_options = json.loads(job["csv_options"])
+        archive_path = self.queue.archive_path(job)
+        rendered = failed = 0
+
+        def read_records():
+            return iter_csv_records(self.queue.csv_path(job_id), **csv_options)
+
+        cancel_event = threading.Event()
+        try:
+            check = precheck_batch(read_records(), settings)
+            settings = check.settings
+            self.queue.update(job_id, total=check.to_render, skipped=len(check.skip), version=settings["version"],
+                              notes="; ".join(check.summary_lines()) or None)
+            jobs = iter_batch_jobs(check.filter(read_records()), "", settings)
+            last_update = time.monotonic()
+            with BatchArchive(archive_path) as archive:
+                if check.issues:
+                    archive.add_file(PRECHECK_REPORT_FILENAME, check.report_csv().encode("utf-8"))
+                for r in iter_batch_results(jobs, settings, self.workers, self.chunk_size, cancel_event=cancel_event,
+                                            in_memory=True, pool=pool):
+                    archive.add(r)
+                    if r.error:
+                        failed += 1
+                    else:
+                        rendered += 1
+                    if time.monotonic() - last_update >= PROGRESS_INTERVAL_S:
+                        last_update = time.monotonic()
+                        self.queue.update(job_id, rendered=rendered, failed=failed)
+                        if self._stopping.is_set() or self.queue.cancel_requested(job_id):
+                            cancel_event.set()
+        except BrokenProcessPool:
+            raise  # _serve fails the job and starts a new pool
+        except Exception as e:
+            # Anything else fails this job only; the runner moves on to the next one
+            self.queue.update(job_id, status="failed", finished=time.time(), rendered=rendered, failed=failed,
+                              error=f"{type(e).__name__}: {e}")
+            archive_path.unlink(missing_ok=True)
+            return
+
+        if self._stopping.is_set():
+            archive_path.unlink(missing_ok=True)  # left "running": redone from the start next time
+            return
+        status = "cancelled" if cancel_event.is_set() else "done"
+        if status == "cancelled":
+            archive_path.unlink(missing_ok=True)
+        self.queue.update(job_id, status=status, finished=time.time(), rendered=rendered, failed=failed)
+
+
+def job_status(job: dict) -> dict:
+    """The public view of a job row (what GET /jobs/<id> returns)."""
+    status = {key: job[key] for key in ("id", "status", "created", "started", "finished", "total", "rendered",
+                                        "failed", "skipped", "version", "notes", "error")}
+    status["settings"] = json.loads(job["settings"])
+    status["archive_url"] = f"/jobs/{job['id']}/archive" if job["status"] == "done" else None
+    return status
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    server_version = "qr-sticker-jobs/1"
+
+    @property
+    def queue(self) -> JobQueue:
+        return self.server.queue
+
+    def _path_parts(self):
+        return [part for part in urlsplit(self.path).path.split("/") if part]
+
+    def _send_json(self, code: int, data):
+        body = json.dumps(data, indent=2).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, code: int, message: str):
+        self._send_json(code, {"error": message})
+
+    def do_POST(self):
+        if self._path_parts() != ["jobs"]:
+            return self._send_error(HTTPStatus.NOT_FOUND, "use POST /jobs")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            return self._send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"upload is over {MAX_UPLOAD_BYTES} bytes")
+        body = self.rfile.read(length)
+        try:
+            csv_text, settings, csv_options, suffix = parse_job_request(
+                body, self.headers.get("Content-Type", ""), urlsplit(self.path).query
+            )
+        except (ValueError, TypeError, UnicodeDecodeError) as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+        job = self.queue.submit(csv_text, settings, csv_options, suffix)
+        self._send_json(HTTPStatus.CREATED, job_status(job))
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ["jobs"]:
+            return self._send_json(HTTPStatus.OK, [job_status(job) for job in self.queue.list()])
+        job = self.queue.get(parts[1]) if len(parts) in (2, 3) and parts[0] == "jobs" else None
+        if job is None:
+            return self._send_error(HTTPStatus.NOT_FOUND, "no such job")
+        if len(parts) == 2:
+            return self._send_json(HTTPStatus.OK, job_status(job))
+        if parts[2] != "archive":
+            return self._send_error(HTTPStatus.NOT_FOUND, "no such resource")
+        if job["status"] != "done":
+            return self._send_error(HTTPStatus.CONFLICT, f"job is {job['status']}")
+        path = self.queue.archive_path(job)
+        with open(path, "rb") as f:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", ARCHIVE_CONTENT_TYPES[archive_format(path)])
+            self.send_header("Content-Length", str(path.stat().st_size))
+            self.send_header("Content-Disposition", f'attachment; filename="{job["archive"]}"')
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_DELETE(self):
+        parts = self._path_parts()
+        job = self.queue.cancel(parts[1]) if len(parts) == 2 and parts[0] == "jobs" else None
+        if job is None:
+            return self._send_error(HTTPStatus.NOT_FOUND, "no such job")
+        self._send_json(HTTPStatus.OK, job_status(job))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start_server(data_dir=DEFAULT_DATA_DIR, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers=None,
+                 chunk_size: int = 32, encode_cache_path=None, verbose: bool = False):
+    """
+    Binds the HTTP server (port 0 picks a free port), opens the queue and starts the runner.
+    Returns (server, runner); call server.serve_forever(), then runner.stop() and
+    server.server_close() to shut down. Run one server per data folder.
+    """
+    # Bind first: a second server that cannot get the port must not touch the queue
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.queue = queue = JobQueue(data_dir)
+    server.verbose = verbose
+    queue.requeue_running()
+    workers = workers or os.cpu_count() or 1
+    runner = JobRunner(queue, workers, chunk_size, encode_cache_path or str(queue.data_dir / ENCODE_CACHE_FILENAME))
+    runner.start()
+    return server, runner
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.main serve",
+                                     description="Local job server that renders CSV batches into archives.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port (default: {DEFAULT_PORT})")
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR),
+                        help=f"folder for the job table, uploaded CSVs and archives (default: {DEFAULT_DATA_DIR})")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per CPU core)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="stickers per work unit sent to a worker (default: 32)")
+    parser.add_argument("--encode-cache", default=None,
+                        help=f"SQLite file caching encoded QR codes (default: {ENCODE_CACHE_FILENAME} in the data folder)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    try:
+        server, runner = start_server(args.data_dir, args.host, args.port, args.workers, args.chunk_size,
+                                      args.encode_cache, args.verbose)
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    # Stop the same way on SIGTERM (service managers) as on Ctrl+C
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    host, port = server.server_address[:2]
+    print(f"Job server on http://{host}:{port}/jobs ({runner.workers} workers, data in {runner.queue.data_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping (a running job is picked up again on the next start)", file=sys.stderr)
+    finally:
+        runner.stop()
+        server.server_close()
+        runner.join()
+        runner.queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# src/layout.py
+# Layout engine for luggage tags. A layout (JSON) places zones on a template: the QR code,
+# the caption, extra text such as the device ID and logos. Everything that is the same on
+# every tag (template, logos, fixed text) is drawn once into a base image; per tag only the
+# variable zones are drawn, each on its own crop of the base, and pasted back with a plain
+# paste. The cost per tag then follows the size of the variable zones, not the canvas.
+#
+# Layout file:
+# {
+#   "template": "tag_template.png",            (relative to the layout file; default: bundled template)
+#   "zones": [
+#     {"type": "qr", "box": [0, 0, 827, 472], "size": 0.75},
+#     {"type": "caption", "box": [0, 413, 827, 59], "max_size": 28, "min_size": 6, "valign": "top"},
+#     {"type": "text", "box": [1100, 110, 880, 110], "text": "ID: {device_id}", "align": "left"},
+#     {"type": "logo", "box": [2100, 160, 150, 150], "image": "logo.png"}
+#   ]
+# }
+# Boxes are [x, y, width, height] in template pixels. Optional keys: align (left, center,
+# right), valign (top, middle, bottom), padding (px), and for text: font, max_size,
+# min_size, color. Text may use {url}, {device_id} and {label}; text without placeholders
+# is static. Zones are drawn in order, so a later zone wins where boxes overlap.
+
+import json
+import string
+from pathlib import Path
+from PIL import Image, ImageDraw
+from .fonts import fit_font
+from .timing import stage
+from .utils import extract_slug
+
+ZONE_TYPES = ["qr", "caption", "text", "logo"]
+ALIGNMENTS = ["left", "center", "right"]
+VERTICAL_ALIGNMENTS = ["top", "middle", "bottom"]
+PLACEHOLDERS = ["url", "device_id", "label"]
+
+MAX_CAPTION_CHARS = 80
+
+
+def _offset(space: int, size: int, align: str) -> int:
+    if align in ("left", "top"):
+        return 0
+    if align in ("right", "bottom"):
+        return space - size
+    return (space - size) // 2
+
+
+def _placeholders(text: str):
+    return [name for _, name, _, _ in string.Formatter().parse(text) if name is not None]
+
+
+def _check_zone(zone: dict, number: int) -> dict:
+    where = f"zone {number}"
+    kind = zone.get("type")
+    if kind not in ZONE_TYPES:
+        raise ValueError(f"Layout {where}: type must be one of {', '.join(ZONE_TYPES)}, not {kind!r}")
+    box = zone.get("box")
+    if not (isinstance(box, (list, tuple)) and len(box) == 4 and all(isinstance(v, int) for v in box) and box[2] > 0 and box[3] > 0):
+        raise ValueError(f"Layout {where} ({kind}): box must be [x, y, width, height] in whole pixels")
+    if zone.get("align", "center") not in ALIGNMENTS:
+        raise ValueError(f"Layout {where} ({kind}): align must be one of {', '.join(ALIGNMENTS)}")
+    if zone.get("valign", "middle") not in VERTICAL_ALIGNMENTS:
+        raise ValueError(f"Layout {where} ({kind}): valign must be one of {', '.join(VERTICAL_ALIGNMENTS)}")
+    if kind == "text":
+        if not isinstance(zone.get("text"), str):
+            raise ValueError(f"Layout {where} (text): needs a \"text\" string")
+        unknown = [name for name in _placeholders(zone["text"]) if name not in PLACEHOLDERS]
+        if unknown:
+            raise ValueError(f"Layout {where} (text): unknown placeholder {{{unknown[0]}}} (use {', '.join(PLACEHOLDERS)})")
+    if kind == "logo" and not zone.get("image"):
+        raise ValueError(f"Layout {where} (logo): needs an \"image\" path")
+    if kind == "qr" and not 0 < zone.get("size", 1.0) <= 1:
+        raise ValueError(f"Layout {where} (qr): size is a fraction of the box height (0-1]")
+    return zone
+
+
+class TagLayout:
+    """
+    A loaded layout: template, zones and the pre-rendered static base. Build one with
+    load_layout(), or from default_zones(), and call render() per tag.
+    """
+
+    def __init__(self, template: Image.Image, zones, base_dir=None, font_path=None):
+        self.zones = [_check_zone(dict(zone), i) for i, zone in enumerate(zones, start=1)]
+        if not any(zone["type"] == "qr" for zone in self.zones):
+            raise ValueError("Layout has no qr zone")
+        self.base_dir = Path(base_dir) if base_dir else None
+        self.font_path = font_path
+        self.size = template.size
+
+        # Static layers are drawn once into the base; without any, the base is the
+        # (already RGBA) cached template itself rather than a second full-size copy
+        static = [zone for zone in self.zones if self._is_static(zone)]
+        self.base = template if not static and template.mode == "RGBA" else template.convert("RGBA")
+        self.dynamic = []  # (zone, crop of the base under it)
+        for zone in static:
+            self._draw_static(zone)
+        for zone in self.zones:
+            if not self._is_static(zone):
+                x, y, w, h = zone["box"]
+                self.dynamic.append((zone, self.base.crop((x, y, x + w, y + h))))
+
+    @staticmethod
+    def _is_static(zone: dict) -> bool:
+        return zone["type"] == "logo" or (zone["type"] == "text" and not _placeholders(zone["text"]))
+
+    def _draw_static(self, zone: dict):
+        x, y, w, h = zone["box"]
+        if zone["type"] == "logo":
+            path = Path(zone["image"])
+            if not path.is_absolute() and self.base_dir is not None:
+                path = self.base_dir / path
+            with Image.open(path) as src:
+                logo = src.convert("RGBA")
+            logo.thumbnail((w, h), Image.Resampling.LANCZOS)
+            pos = (x + _offset(w, logo.width, zone.get("align", "center")),
+                   y + _offset(h, logo.height, zone.get("valign", "middle")))
+            self.base.alpha_composite(logo, pos)
+        else:
+            patch = self.base.crop((x, y, x + w, y + h))
+            self._draw_text(patch, zone, zone["text"])
+            self.base.paste(patch, (x, y))
+
+    def _draw_text(self, patch: Image.Image, zone: dict, text: str):
+        font, position = self._fit_text(zone, patch.size, text)
+        ImageDraw.Draw(patch).text(position, text, fill=zone.get("color", "black"), font=font)
+
+    def _fit_text(self, zone: dict, size, text: str):
+        """The largest font that fits text in a zone of size (w, h), and where to draw it."""
+        w, h = size
+        padding = zone.get("padding", 0)
+        font, bbox = fit_font(text, w - 2 * padding, zone.get("max_size", 28), zone.get("min_size", 6),
+                              zone.get("font") or self.font_path)
+        text_width = bbox[2] - bbox[0]
+        if zone.get("align", "center") == "center":
+            text_x = (w - text_width) // 2
+        else:
+            text_x = padding + _offset(w - 2 * padding, text_width, zone["align"])
+        text_y = _offset(h, bbox[3], zone.get("valign", "middle"))
+        return font, (text_x, text_y)
+
+    def render(self, qr_img: Image.Image, url: str, caption=None) -> Image.Image:
+        """
+        Returns the finished RGBA tag. qr_img is the QR code rendered at qr_px() (see
+        generator.render_qr_modules); caption replaces the URL in caption zones.
+        """
+        with stage("template"):
+            tag = self.base.copy()
+        patches = self.render_patches(qr_img, url, caption)
+        with stage("composite"):
+            for patch, position in patches:
+                # Plain paste: the patch already holds the base pixels under the zone
+                tag.paste(patch, position)
+        return tag
+
+    def render_patches(self, qr_img: Image.Image, url: str, caption=None):
+        """
+        The dynamic zones of a tag as [(patch, (x, y))] to paste over the base, without
+        copying the whole base (see render() and lowmem.TagRows).
+        """
+        patches = []
+        fields = {"url": url, "device_id": extract_slug(url), "label": caption or ""}
+        for zone, background in self.dynamic:
+            kind = zone["type"]
+            if kind == "qr":
+                with stage("composite"):
+                    patch = background.copy()
+                    w, h = patch.size
+                    qr = qr_img if qr_img.height <= h else qr_img.resize((h, h), Image.Resampling.NEAREST)
+                    patch.paste(qr, (_offset(w, qr.width, zone.get("align", "center")),
+                                     _offset(h, qr.height, zone.get("valign", "middle"))))
+            else:
+                if kind == "caption":
+                    text = caption or url
+                    text = text if len(text) <= MAX_CAPTION_CHARS else text[:MAX_CAPTION_CHARS - 3] + "..."
+                else:
+                    text = zone["text"].format(**fields)
+                # Font fitting is timed as its own stage, so it stays outside "composite"
+                font, position = self._fit_text(zone, background.size, text)
+                with stage("composite"):
+                    patch = background.copy()
+                    ImageDraw.Draw(patch).text(position, text, fill=zone.get("color", "black"), font=font)
+            patches.append((patch, tuple(zone["box"][:2])))
+        return patches
+
+    def qr_px(self) -> int:
+        """Target QR size in pixels: the first qr zone's height times its size (others are scaled to fit)."""
+        zone = next(zone for zone in self.zones if zone["type"] == "qr")
+        return int(zone["box"][3] * zone.get("size", 1.0))
+
+
+def default_zones(qr_zone=(0, 0, 827, 472)):
+    """The classic tag: QR at 75% of the zone height, centred, URL caption underneath."""
+    x, y, w, h = qr_zone
+    qr_size = int(h * 0.75)
+    text_y = qr_size + (h - qr_size) // 2
+    return [
+        {"type": "qr", "box": [x, y, w, h], "size": 0.75},
+        {"type": "caption", "box": [x, y + text_y, w, h - text_y], "valign": "top",
+         "padding": int(w * 0.05), "max_size": 28, "min_size": 6},
+    ]
+
+
+def read_layout(path) -> dict:
+    """
+    Reads and checks a layout JSON file. "template" comes back as an absolute Path
+    (None = the bundled template) and "base_dir" is the folder logos are relative to.
+    """
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get("zones"), list):
+        raise ValueError(f"Layout {path} needs a \"zones\" list")
+    template = data.get("template")
+    data["template"] = (path.parent / template).resolve() if template else None
+    data["base_dir"] = path.parent
+    return data
+
+
+def load_layout(path, font_path=None, template: Image.Image = None) -> TagLayout:
+    """Loads a layout file; pass template to use an already decoded template image."""
+    data = read_layout(path)
+    if template is None:
+        from .generator import DEFAULT_TEMPLATE_PATH
+        with Image.open(data["template"] or DEFAULT_TEMPLATE_PATH) as src:
+            template = src.convert("RGBA")
+    return TagLayout(template, data["zones"], data["base_dir"], font_path)
@@ -0,0 +1,270 @@
+# src/lowmem.py
+# Memory-bounded rendering for very high DPI and large-format stickers (--low-memory).
+# A sticker is never held as one full image: RectRows / TagRows build any band of rows on
+# demand (rectangles from the module matrix and a caption band in greyscale, luggage tags
+# from the template base and the few dynamic zone patches) and write_png() encodes the
+# PNG strip by strip with its own zlib stream. Peak memory per worker is then a few MB
+# of strips instead of several full RGB(A) canvases, so many workers fit in a small
+# container. peak_rss() / MemoryReport report the high-water mark of every sticker (on
+# Linux it is reset before each one; elsewhere it is the process peak so far).
+
+import csv
+import os
+import struct
+import sys
+import zlib
+from PIL import Image, ImageDraw
+from .generator import (
+    encode_qr, render_qr_modules, get_tag_layout, rect_sticker_size, rect_qr_position, fit_rect_caption
+)
+from .timing import stage
+from .writer import DEFAULT_PNG_OPTIONS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MEMORY_REPORT_FILENAME = "qr_memory_report.csv"
+
+# Linux can reset a process's RSS high-water mark (proc(5), clear_refs "5")
+_CLEAR_REFS = "/proc/self/clear_refs"
+PER_STICKER_PEAK = sys.platform.startswith("linux") and os.access(_CLEAR_REFS, os.W_OK)
+
+# Raw pixel bytes per strip handed to zlib (bounds the working set per sticker)
+STRIP_BYTES = 2 * 1024 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG (bit depth, colour type) per Pillow mode written
+_PNG_FORMATS = {"1": (1, 0), "L": (8, 0), "RGB": (8, 2), "RGBA": (8, 6)}
+
+# writer.PNG_COLOR_MODES -> mode of the written strips for greyscale stickers; the
+# adaptive palette needs the whole image, so "P" is written as 8-bit greyscale
+_STRIP_MODES = {"rgb": "RGB", "L": "L", "P": "L", "1": "1"}
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss() -> bool:
+    """Resets the RSS high-water mark so peak_rss() covers what follows; False where that is not possible."""
+    if not PER_STICKER_PEAK:
+        return False
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+class RectRows:
+    """Rows of a rectangular PNG sticker (greyscale), the same pixels as generator.render_rectangle_qr_image."""
+
+    mode = "L"
+
+    def __init__(self, url: str, spec, caption=None):
+        width_px, height_px, qr_height = rect_sticker_size(spec.width_mm, spec.height_mm, spec.dpi)
+        self.size = (width_px, height_px)
+        matrix, _ = encode_qr(url, spec.version, spec.error_level)
+        self._matrix = matrix
+        self._scale = max(1, qr_height // len(matrix))
+        qr_px = len(matrix) * self._scale
+        self._qr_x, self._qr_y = rect_qr_position(width_px, height_px, qr_height, qr_px, spec.include_url_text)
+        self._qr_px = qr_px
+        self._white = b"\xff" * width_px
+        self._module_rows = {}  # module row -> one row of pixels
+
+        # The caption band: only the rows the text covers, drawn over whatever is under them
+        self._band = None
+        if spec.include_url_text:
+            text, font, (text_x, text_y) = fit_rect_caption(caption or url, width_px, qr_height, spec.dpi, spec.font_path)
+            top, bottom = font.getbbox(text)[1::2]
+            band_top, band_bottom = max(0, text_y + top), min(height_px, text_y + bottom)
+            if band_bottom > band_top:
+                with stage("composite"):
+                    band = Image.frombytes("L", (width_px, band_bottom - band_top), self._plain_rows(band_top, band_bottom))
+                    ImageDraw.Draw(band).text((text_x, text_y - band_top), text, fill=0, font=font)
+                self._band = (band_top, band_bottom, band.tobytes())
+
+    def _row(self, y: int) -> bytes:
+        if not self._qr_y <= y < self._qr_y + self._qr_px:
+            return self._white
+        module_row = (y - self._qr_y) // self._scale
+        row = self._module_rows.get(module_row)
+        if row is None:
+            dark, light = b"\x00" * self._scale, b"\xff" * self._scale
+            pixels = b"".join(dark if module else light for module in self._matrix[module_row])
+            # Clip like Image.paste does when the QR is wider than the sticker
+            x = self._qr_x
+            if x < 0:
+                pixels, x = pixels[-x:], 0
+            row = (self._white[:x] + pixels + self._white)[:self.size[0]]
+            self._module_rows[module_row] = row
+        return row
+
+    def _plain_rows(self, y0: int, y1: int) -> bytes:
+        return b"".join(self._row(y) for y in range(y0, y1))
+
+    def strip(self, y0: int, y1: int) -> Image.Image:
+        """Rows y0 to y1 (exclusive) as an "L" image."""
+        width = self.size[0]
+        with stage("composite"):
+            if self._band is None or y1 <= self._band[0] or y0 >= self._band[1]:
+                data = self._plain_rows(y0, y1)
+            else:
+                band_top, band_bottom, band = self._band
+                top, bottom = max(y0, band_top), min(y1, band_bottom)
+                data = b"".join((
+                    self._plain_rows(y0, top),
+                    band[(top - band_top) * width:(bottom - band_top) * width],
+                    self._plain_rows(bottom, y1),
+                ))
+            return Image.frombytes("L", (width, y1 - y0), data)
+
+
+class TagRows:
+    """Rows of a luggage tag (RGBA): the layout's static base with the dynamic zone patches on top."""
+
+    mode = "RGBA"
+
+    def __init__(self, url: str, spec, caption=None, on_version_adjusted=None):
+        self._layout = layout = get_tag_layout(spec.template_path, spec.qr_zone, spec.font_path, spec.layout_path)
+        self.size = layout.size
+        matrix, actual_version = encode_qr(url, spec.version, spec.error_level)
+        if actual_version != spec.version and on_version_adjusted is not None:
+            on_version_adjusted(spec.version, actual_version, url)
+        # Only the zone patches are kept; the full-size QR image is dropped right away
+        self._patches = layout.render_patches(render_qr_modules(matrix, layout.qr_px()), url, caption)
+
+    def strip(self, y0: int, y1: int) -> Image.Image:
+        """Rows y0 to y1 (exclusive) as an "RGBA" image."""
+        with stage("composite"):
+            strip = self._layout.base.crop((0, y0, self.size[0], y1))
+            for patch, (x, y) in self._patches:
+                if y < y1 and y + patch.height > y0:
+                    strip.paste(patch, (x, y - y0))
+        return strip
+
+
+def sticker_rows(url: str, spec, caption=None, on_version_adjusted=None):
+    """RectRows or TagRows for a PNG sticker.StickerSpec."""
+    if spec.mode == "luggage":
+        return TagRows(url, spec, caption, on_version_adjusted)
+    if spec.output_svg:
+        raise ValueError("SVG stickers have no rows, write them with sticker.render_to()")
+    return RectRows(url, spec, caption)
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def write_png(rows, target, dpi=None, png_options=None):
+    """
+    Encodes rows (RectRows / TagRows) as a PNG into target (a path or a writable binary
+    buffer), STRIP_BYTES of pixels at a time. png_options are writer.save_png's; the
+    colour mode applies to rectangles (tags stay RGBA) and "P" is written as greyscale.
+    """
+    options = dict(DEFAULT_PNG_OPTIONS)
+    options.update(png_options or {})
+    mode = rows.mode if rows.mode == "RGBA" else _STRIP_MODES[options["color"]]
+    bit_depth, color_type = _PNG_FORMATS[mode]
+    width, height = rows.size
+    # Strips are sized on the larger of the rendered and the written row ("1" packs 8 px a byte)
+    bytes_per_row = width * max(len(rows.mode), len(mode) if mode != "1" else 1)
+    strip_height = max(1, STRIP_BYTES // bytes_per_row)
+    level = 9 if options["optimize"] else options["compress_level"]
+
+    # Building strips is timed as "composite" by rows.strip(); only encoding and I/O count as "save"
+    with stage("save"):
+        f = target if hasattr(target, "write") else open(target, "wb")
+    try:
+        with stage("save"):
+            f.write(PNG_SIGNATURE)
+            f.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)))
+            if dpi:
+                # Same pixels-per-metre rounding as Pillow
+                ppm = int(dpi / 0.0254 + 0.5)
+                f.write(_chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1)))
+            compressor = zlib.compressobj(level)
+        previous = None
+        for y0 in range(0, height, strip_height):
+            y1 = min(height, y0 + strip_height)
+            strip = rows.strip(y0, y1)
+            with stage("save"):
+                raw = _strip_for_png(strip, mode).tobytes()
+                del strip
+                stride = len(raw) // (y1 - y0)
+                filtered = []
+                for i in range(0, len(raw), stride):
+                    row = raw[i:i + stride]
+                    # Each module row repeats scale times: a repeat is an all-zero "Up"
+                    # filtered row, anything else goes unfiltered
+                    filtered.append(b"\x02" + bytes(stride) if row == previous else b"\x00" + row)
+                    previous = row
+                data = compressor.compress(b"".join(filtered))
+                del raw, filtered
+                if data:
+                    f.write(_chunk(b"IDAT", data))
+        with stage("save"):
+            f.write(_chunk(b"IDAT", compressor.flush()))
+            f.write(_chunk(b"IEND", b""))
+    finally:
+        if f is not target:
+            f.close()
+
+
+def _strip_for_png(strip: Image.Image, mode: str) -> Image.Image:
+    if strip.mode == mode:
+        return strip
+    if mode == "1":
+        # Same threshold as writer.convert_for_png
+        return strip.point(lambda v: 255 if v >= 128 else 0, mode="1")
+    return strip.convert(mode)
+
+
+class MemoryReport:
+    """
+    CSV of the worker's peak RSS for each low-memory batch item (batch.ItemResult with peak_rss set).
+    Without PER_STICKER_PEAK the column is the worker's process peak so far and is named so.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.peak = None  # largest batch.ItemResult.peak_rss seen
+        self.peak_index = None
+        self._file = None
+        self._writer = None
+
+    def add(self, result):
+        if result.peak_rss is None:
+            return
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._file)
+            column = "peak_rss_mb" if PER_STICKER_PEAK else "process_peak_rss_mb"
+            self._writer.writerow(["index", "url", "filename", column])
+        self.count += 1
+        if self.peak is None or result.peak_rss > self.peak:
+            self.peak, self.peak_index = result.peak_rss, result.index
+        self._writer.writerow([result.index, result.url, result.filename, f"{result.peak_rss / 2**20:.1f}"])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,6 +1,16 @@
 # QR sticker printing app for sensibee
 
-from src.ui import launch_gui
+import sys
 
 if __name__ == "__main__":
+    # python -m src.main batch ...  -> headless batch mode, no Tk needed
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from src.cli import main
+        sys.exit(main(sys.argv[2:]))
+    # python -m src.main serve ...  -> local job server (see job_server.py)
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from src.job_server import main
+        sys.exit(main(sys.argv[2:]))
+
+    from src.ui import launch_gui
     launch_gui()
@@ -0,0 +1,103 @@
+# src/manifest.py
+# JSON-lines record of finished batch items, so an interrupted or repeated batch only
+# renders what is missing. One line per item: url, settings hash, output path, status.
+
+import hashlib
+import json
+from pathlib import Path
+
+MANIFEST_FILENAME = "qr_manifest.jsonl"
+
+
+def settings_hash(settings: dict) -> str:
+    """Short stable hash of everything that affects how a sticker looks."""
+    data = dict(settings)
+    # Cache location, writer threads, bulk rendering, scan checks and timers do not change the output
+    for key in ("encode_cache_path", "writer_threads", "bulk_render", "verify_every", "verify_min_module_px",
+                "verify_min_quiet_zone", "timing"):
+        data.pop(key, None)
+    # A changed template or layout file must re-render the luggage tags that use it
+    if data.get("mode") == "luggage":
+        from .generator import DEFAULT_TEMPLATE_PATH
+        template = Path(data.get("template_path") or DEFAULT_TEMPLATE_PATH)
+        layout = Path(data["layout_path"]) if data.get("layout_path") else None
+        if layout is not None and layout.exists():
+            from .layout import read_layout
+            data["layout_mtime"] = layout.stat().st_mtime_ns
+            template = read_layout(layout)["template"] or DEFAULT_TEMPLATE_PATH
+        data["template_mtime"] = template.stat().st_mtime_ns if template.exists() else None
+    encoded = json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class BatchManifest:
+    """
+    Manifest file in a batch output folder. Entries are appended as items finish
+    (later lines win), so the file stays valid however the run ends.
+    """
+
+    def __init__(self, saved_dir, settings: dict):
+        self.path = Path(saved_dir) / MANIFEST_FILENAME
+        self.settings_hash = settings_hash(settings)
+        self._done = {}
+        if self.path.exists():
+            self._load()
+        self._file = None
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                key = entry.get("output")
+                if entry.get("status") == "done":
+                    self._done[key] = (entry.get("url"), entry.get("label"), entry.get("settings_hash"))
+                else:
+                    self._done.pop(key, None)
+
+    def forget(self):
+        """Treats every item as not done (the file is still appended to)."""
+        self._done.clear()
+
+    def is_done(self, job) -> bool:
+        """True if job was rendered earlier with the same URL, label and settings and its file is still there."""
+        if self._done.get(job.filename) != (job.url, job.label, self.settings_hash):
+            return False
+        output = Path(job.filename)
+        return output.exists() and output.stat().st_size > 0
+
+    def record(self, result):
+        """Appends the outcome of an ItemResult."""
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        entry = {
+            "index": result.index,
+            "url": result.url,
+            "label": result.label,
+            "settings_hash": self.settings_hash,
+            "output": result.filename,
+            "status": "failed" if result.error else "done",
+        }
+        if result.error:
+            entry["error"] = result.error
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+        if result.error:
+            self._done.pop(result.filename, None)
+        else:
+            self._done[result.filename] = (result.url, result.label, self.settings_hash)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,129 @@
+# src/precheck.py
+# One fast pass over a batch before anything is rendered: drops repeated URLs (first row
+# wins), drops URLs too long for any QR version, picks the QR version that fits all the
+# rest, and flags rows whose device IDs would make confusing file names (two URLs with
+# the same slug, or no device ID at all). The render pass then only sees unique, valid
+# rows, so no time is spent on duplicates and nothing fails half way for its length.
+
+import csv
+import io
+from collections import namedtuple
+from .qr_info import batch_min_version
+from .utils import extract_slug
+
+PRECHECK_REPORT_FILENAME = "qr_precheck_report.csv"
+
+# What utils.extract_slug returns for a URL without a usable device ID
+FALLBACK_SLUG = "qr-sticker"
+
+# Issue kinds; the first two are left out of the batch (duplicates unless kept), the
+# others are only reported
+DUPLICATE = "duplicate"
+TOO_LONG = "too_long"
+SLUG_COLLISION = "slug_collision"
+NO_DEVICE_ID = "no_device_id"
+SKIPPED_KINDS = (DUPLICATE, TOO_LONG)
+
+# One reported row; detail is a human readable explanation
+PrecheckIssue = namedtuple("PrecheckIssue", ["index", "url", "slug", "kind", "detail"])
+
+
+class BatchPrecheck:
+    """
+    Result of precheck_batch(). settings is the batch settings with the QR version that
+    fits every kept URL, longest the record that raised it (or None) and total/to_render
+    the rows read and the rows left to render. filter() drops the skipped rows from a
+    second read of the same records.
+    """
+
+    def __init__(self, settings: dict, keep_duplicates: bool = False):
+        self.settings = settings
+        self.keep_duplicates = keep_duplicates
+        self.longest = None
+        self.total = 0
+        self.issues = []
+        self.skip = set()  # indexes of the rows left out
+
+    @property
+    def to_render(self) -> int:
+        return self.total - len(self.skip)
+
+    def count(self, kind: str) -> int:
+        return sum(1 for issue in self.issues if issue.kind == kind)
+
+    def filter(self, records):
+        """Yields the records that are not skipped (pass a fresh read of the same CSV)."""
+        for record in records:
+            if record.index not in self.skip:
+                yield record
+
+    def summary_lines(self):
+        """Short notes for the user, empty when nothing was found."""
+        lines = []
+        counts = {kind: self.count(kind) for kind in (DUPLICATE, TOO_LONG, SLUG_COLLISION, NO_DEVICE_ID)}
+        if counts[DUPLICATE]:
+            lines.append(f"{counts[DUPLICATE]} duplicate URL(s) {'rendered again' if self.keep_duplicates else 'skipped'}")
+        if counts[TOO_LONG]:
+            lines.append(f"{counts[TOO_LONG]} URL(s) too long for any QR version skipped")
+        if counts[SLUG_COLLISION]:
+            lines.append(f"{counts[SLUG_COLLISION]} URL(s) share a device ID with another row")
+        if counts[NO_DEVICE_ID]:
+            lines.append(f"{counts[NO_DEVICE_ID]} URL(s) have no device ID (file names fall back to '{FALLBACK_SLUG}')")
+        return lines
+
+    def report_csv(self) -> str:
+        """The issues as CSV text, sorted by row."""
+        text = io.StringIO(newline="")
+        writer = csv.writer(text)
+        writer.writerow(["index", "url", "device_id", "issue", "skipped", "detail"])
+        for issue in sorted(self.issues):
+            writer.writerow([issue.index, issue.url, issue.slug, issue.kind,
+                             "yes" if issue.index in self.skip else "no", issue.detail])
+        return text.getvalue()
+
+    def write_report(self, path):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(self.report_csv())
+
+
+def precheck_batch(records, settings: dict, keep_duplicates: bool = False) -> BatchPrecheck:
+    """
+    Reads csv_input.BatchRecords once and returns a BatchPrecheck. With keep_duplicates,
+    repeated URLs are reported but still rendered.
+    """
+    result = BatchPrecheck(settings, keep_duplicates)
+    first_row = {}   # url -> index of its first row
+    slug_owner = {}  # slug -> (index, url) of the first row that used it
+
+    def unique_items():
+        for record in records:
+            result.total += 1
+            url = record.url
+            slug = extract_slug(url)
+            first = first_row.get(url)
+            if first is not None:
+                result.issues.append(PrecheckIssue(record.index, url, slug, DUPLICATE, f"same URL as row {first}"))
+                if not keep_duplicates:
+                    result.skip.add(record.index)
+                    continue
+            else:
+                first_row[url] = record.index
+                if slug == FALLBACK_SLUG:
+                    result.issues.append(PrecheckIssue(record.index, url, slug, NO_DEVICE_ID, "no deviceId or path in the URL"))
+                else:
+                    owner = slug_owner.setdefault(slug, (record.index, url))
+                    if owner[1] != url:
+                        result.issues.append(PrecheckIssue(
+                            record.index, url, slug, SLUG_COLLISION, f"device ID '{slug}' also used by row {owner[0]} ({owner[1]})"
+                        ))
+            yield record, url
+
+    version, result.longest, too_long = batch_min_version(unique_items(), settings["error_level"], settings["version"])
+    for record in too_long:
+        result.issues.append(PrecheckIssue(
+            record.index, record.url, extract_slug(record.url), TOO_LONG,
+            f"{len(record.url)} characters do not fit QR version 40 at level {settings['error_level']}"
+        ))
+        result.skip.add(record.index)
+    result.settings = dict(settings, version=version)
+    return result
@@ -1,21 +1,116 @@
 # src/qr_info.py
+# QR code size and capacity (ISO/IEC 18004), exact for versions 1-40 and all four error
+# correction levels. The generator encodes each URL as a single segment, so a version
+# chosen here is exactly the smallest one the encoder will accept.
+
+MIN_VERSION = 1
+MAX_VERSION = 40
+
+# Data codewords (8 bits each) per version 1-40, after error correction
+DATA_CODEWORDS = {
+    "L": [19, 34, 55, 80, 108, 136, 156, 194, 232, 274, 324, 370, 428, 461, 523, 589, 647, 721, 795, 861,
+          932, 1006, 1094, 1174, 1276, 1370, 1468, 1531, 1631, 1735, 1843, 1955, 2071, 2191, 2306, 2434, 2566, 2702, 2812, 2956],
+    "M": [16, 28, 44, 64, 86, 108, 124, 154, 182, 216, 254, 290, 334, 365, 415, 453, 507, 563, 627, 669,
+          714, 782, 860, 914, 1000, 1062, 1128, 1193, 1267, 1373, 1455, 1541, 1631, 1725, 1812, 1914, 1992, 2102, 2216, 2334],
+    "Q": [13, 22, 34, 48, 62, 76, 88, 110, 132, 154, 180, 206, 244, 261, 295, 325, 367, 397, 445, 485,
+          512, 568, 614, 664, 718, 754, 808, 871, 911, 985, 1033, 1115, 1171, 1231, 1286, 1354, 1426, 1502, 1582, 1666],
+    "H": [9, 16, 26, 36, 46, 60, 66, 86, 100, 122, 140, 158, 180, 197, 223, 253, 283, 313, 341, 385,
+          406, 442, 464, 514, 538, 596, 628, 661, 701, 745, 793, 845, 901, 961, 986, 1054, 1096, 1142, 1222, 1276],
+}
+
+NUMERIC = "numeric"
+ALPHANUMERIC = "alphanumeric"
+BYTE = "byte"
+ENCODING_MODES = [NUMERIC, ALPHANUMERIC, BYTE]
+
+ALPHANUMERIC_CHARS = frozenset("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:")
+
+# Character count indicator length per mode for versions 1-9, 10-26 and 27-40
+_COUNT_BITS = {
+    NUMERIC: (10, 12, 14),
+    ALPHANUMERIC: (9, 11, 13),
+    BYTE: (8, 16, 16),
+}
+_MODE_BITS = 4
 
-def get_qr_capacity_lookup():
-    # Approximate max character capacities for versions 1–8 (UTF-8/alphanumeric)
-    return {
-        "L": [25, 47, 77, 114, 154, 195, 224, 279],
-        "M": [20, 38, 61, 90, 122, 154, 178, 221],
-        "Q": [16, 29, 47, 67, 87, 108, 125, 157],
-        "H": [10, 20, 35, 50, 64, 84, 93, 122],
-    }
 
 def get_module_size(version: int) -> int:
     """Returns the number of modules (blocks) per side of the QR code."""
     return 21 + (version - 1) * 4
 
-def get_max_chars(version: int, level: str) -> int:
-    """Returns the approximate max number of characters for version + error level."""
-    table = get_qr_capacity_lookup()
-    if 1 <= version <= 8 and level in table:
-        return table[level][version - 1]
-    return -1  # unsupported or unknown
\ No newline at end of file
+
+def detect_mode(data: str) -> str:
+    """The most compact single encoding mode for data (what the generator uses)."""
+    if data and data.isdigit() and data.isascii():
+        return NUMERIC
+    if data and all(ch in ALPHANUMERIC_CHARS for ch in data):
+        return ALPHANUMERIC
+    return BYTE
+
+
+def count_bits(mode: str, version: int) -> int:
+    """Length of the character count indicator for mode at version."""
+    bits = _COUNT_BITS[mode]
+    if version <= 9:
+        return bits[0]
+    return bits[1] if version <= 26 else bits[2]
+
+
+def _payload_bits(mode: str, length: int) -> int:
+    """Bits for length characters (bytes for BYTE mode), without mode/count headers."""
+    if mode == NUMERIC:
+        return 10 * (length // 3) + (0, 4, 7)[length % 3]
+    if mode == ALPHANUMERIC:
+        return 11 * (length // 2) + 6 * (length % 2)
+    return 8 * length
+
+
+def get_max_chars(version: int, level: str, mode: str = BYTE) -> int:
+    """
+    Returns the exact max number of characters for version + error level in the given
+    encoding mode (BYTE counts UTF-8 bytes), or -1 for an unknown version or level.
+    """
+    if not MIN_VERSION <= version <= MAX_VERSION or level not in DATA_CODEWORDS:
+        return -1
+    available = DATA_CODEWORDS[level][version - 1] * 8 - _MODE_BITS - count_bits(mode, version)
+    if mode == NUMERIC:
+        chars = available // 10 * 3
+        rest = available % 10
+        return chars + (2 if rest >= 7 else 1 if rest >= 4 else 0)
+    if mode == ALPHANUMERIC:
+        return available // 11 * 2 + (1 if available % 11 >= 6 else 0)
+    return available // 8
+
+
+def get_qr_capacity_lookup(mode: str = BYTE):
+    """Max characters per error level for versions 1-40 ({level: [v1, ..., v40]})."""
+    return {level: [get_max_chars(v, level, mode) for v in range(MIN_VERSION, MAX_VERSION + 1)] for level in DATA_CODEWORDS}
+
+
+def min_version(data: str, level: str = "M", start: int = MIN_VERSION):
+    """Smallest version >= start that holds data at this error level, or None if even version 40 is too small."""
+    mode = detect_mode(data)
+    length = len(data.encode("utf-8")) if mode == BYTE else len(data)
+    payload = _payload_bits(mode, length)
+    codewords = DATA_CODEWORDS[level.upper()]
+    for version in range(max(start, MIN_VERSION), MAX_VERSION + 1):
+        if _MODE_BITS + count_bits(mode, version) + payload <= codewords[version - 1] * 8:
+            return version
+    return None
+
+
+def batch_min_version(items, level: str = "M", start: int = MIN_VERSION):
+    """
+    One pass over (key, data) pairs: returns (version, longest, too_long) where version is
+    the smallest version >= start that fits every item, longest is the key of the item that
+    set it (None if start already fits all) and too_long lists the keys of items that do
+    not fit any version.
+    """
+    version, longest, too_long = start, None, []
+    for key, data in items:
+        needed = min_version(data, level, version)
+        if needed is None:
+            too_long.append(key)
+        elif needed > version:
+            version, longest = needed, key
+    return version, longest, too_long
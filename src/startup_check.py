@@ -0,0 +1,122 @@
+# src/startup_check.py
+# Import-time check for the headless entry points: python -m src.startup_check
+# Imports each entry module in a fresh interpreter with -X importtime (median of a few
+# runs), lists the slowest imports and fails (exit 1) when a module that is only needed
+# by some runs (Tk, qrcode, NumPy, multiprocessing, cProfile, sqlite3, archives, ...) is
+# imported at startup, or when the import got slower than a saved baseline (--baseline).
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Entry point -> modules it must not import up front (they are imported where used)
+ENTRY_MODULES = {
+    "src.cli": [
+        "tkinter", "qrcode", "urllib.request", "multiprocessing", "cProfile", "pstats",
+        "sqlite3", "tarfile", "zipfile", "numpy", "src.imposition", "src.archive",
+    ],
+    "src.batch": ["tkinter", "qrcode", "urllib.request", "multiprocessing", "cProfile", "pstats", "sqlite3", "numpy"],
+    "src.generator": ["tkinter", "qrcode", "urllib.request", "multiprocessing", "concurrent.futures.process"],
+}
+
+
+def parse_importtime(stderr: str):
+    """
+    Parses -X importtime output into [(module, self_us, cumulative_us, depth)] in import
+    order; depth 0 are the imports made by the command itself.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(fields[0]), int(fields[1]), depth))
+    return rows
+
+
+def measure_import(module: str, python: str = sys.executable):
+    """Imports module once in a fresh interpreter; returns the parsed -X importtime rows."""
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip()}")
+    return parse_importtime(proc.stderr)
+
+
+def check_module(module: str, forbidden, runs: int = 5) -> dict:
+    """Median cumulative import time of module (ms), its slowest imports and forbidden modules it pulled in."""
+    totals = []
+    rows = []
+    for _ in range(runs):
+        rows = measure_import(module)
+        totals.append(next(cum for name, _, cum, depth in rows if name == module and depth == 0) / 1000)
+    imported = {name for name, *_ in rows}
+    slowest = sorted(rows, key=lambda row: row[1], reverse=True)[:10]
+    return {
+        "module": module,
+        "median_ms": statistics.median(totals),
+        "min_ms": min(totals),
+        "slowest": [{"module": name, "self_ms": own / 1000, "cumulative_ms": cum / 1000} for name, own, cum, _ in slowest],
+        "unexpected": sorted(name for name in forbidden if name in imported),
+    }
+
+
+def compare_with_baseline(results, baseline: dict, threshold: float):
+    """Returns (module, baseline ms, current ms) for modules that got slower than threshold x baseline."""
+    base = {r["module"]: r["median_ms"] for r in baseline["results"]}
+    return [(r["module"], base[r["module"]], r["median_ms"]) for r in results
+            if base.get(r["module"]) and r["median_ms"] > base[r["module"]] * threshold]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.startup_check",
+                                     description="Check the import time of the headless entry points.")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_MODULES),
+                        help=f"entry modules to check (default: {', '.join(ENTRY_MODULES)})")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module (default: 5)")
+    parser.add_argument("--baseline", help="JSON from an earlier --out to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown vs --baseline that counts as a regression (default: 1.25)")
+    parser.add_argument("--out", help="write the results as JSON (use as a later --baseline)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list the slowest imports per module")
+    args = parser.parse_args(argv)
+
+    results = []
+    for module in args.modules:
+        result = check_module(module, ENTRY_MODULES.get(module, []), args.runs)
+        results.append(result)
+        print(f"{module:<16} {result['median_ms']:7.1f} ms (min {result['min_ms']:.1f})")
+        if args.verbose:
+            for row in result["slowest"]:
+                print(f"    {row['module']:<36} self {row['self_ms']:6.1f} ms  cumulative {row['cumulative_ms']:6.1f} ms")
+
+    failed = False
+    for result in results:
+        if result["unexpected"]:
+            failed = True
+            print(f"error: {result['module']} imports {', '.join(result['unexpected'])} at startup", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for module, before, now in compare_with_baseline(results, baseline, args.threshold):
+            failed = True
+            print(f"error: import {module} took {now:.1f} ms, baseline {before:.1f} ms", file=sys.stderr)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# src/sticker.py
+# Library API for rendering stickers in memory. A StickerSpec holds everything about the
+# sticker except the URL (kind, size, QR version, fonts, PNG options) and can be reused for
+# any number of renders, shared between threads and sent to worker processes:
+#
+#     spec = StickerSpec("rect", width_mm=50, height_mm=30, include_url_text=True)
+#     png = render_bytes("https://my.sensibee.io/register?deviceId=abc", spec)
+#     img = render_image(url, spec.replace(dpi=600))
+#     render_to(url, spec, "sticker.png")       # or any writable binary buffer
+#
+# The GUI, the CLI batches and generator.create_*() are thin callers of these functions.
+
+import io
+from pathlib import Path
+from .generator import (
+    ERROR_CORRECTION_MAP, render_rectangle_qr_image, render_rectangle_qr_svg, render_luggage_tag_qr_image
+)
+from .qr_info import MIN_VERSION, MAX_VERSION
+from .timing import stage
+from .writer import PNG_COLOR_MODES, save_png
+
+STICKER_MODES = ["rect", "luggage"]
+
+
+class StickerSpec:
+    """
+    Immutable sticker settings. The field names are the matching batch settings keys
+    (see batch.DEFAULT_SETTINGS), so specs convert to and from settings dicts. Use
+    replace() for a changed copy; specs compare by value and can be dict keys.
+    """
+
+    __slots__ = (
+        "mode", "version", "error_level", "font_path",
+        # Rectangular stickers
+        "width_mm", "height_mm", "dpi", "output_svg", "include_url_text",
+        # Luggage tags (layout_path replaces template_path/qr_zone)
+        "template_path", "qr_zone", "layout_path",
+        # PNG output, see writer.save_png
+        "png_compress_level", "png_optimize", "png_color",
+    )
+
+    def __init__(self, mode: str = "rect", version: int = 4, error_level: str = "M", font_path=None,
+                 width_mm: float = 50.0, height_mm: float = 30.0, dpi: int = 300, output_svg: bool = False,
+                 include_url_text: bool = False, template_path=None, qr_zone=(0, 0, 827, 472), layout_path=None,
+                 png_compress_level: int = 6, png_optimize: bool = False, png_color: str = "rgb"):
+        if mode not in STICKER_MODES:
+            raise ValueError(f"Unknown sticker mode '{mode}' (use one of {', '.join(STICKER_MODES)})")
+        error_level = str(error_level).upper()
+        if error_level not in ERROR_CORRECTION_MAP:
+            raise ValueError(f"Unknown error correction level '{error_level}' (use one of {', '.join(ERROR_CORRECTION_MAP)})")
+        if not MIN_VERSION <= int(version) <= MAX_VERSION:
+            raise ValueError(f"QR version must be between {MIN_VERSION} and {MAX_VERSION}, not {version}")
+        if width_mm <= 0 or height_mm <= 0 or dpi <= 0:
+            raise ValueError("Sticker width, height and DPI must be positive")
+        qr_zone = tuple(int(v) for v in qr_zone)
+        if len(qr_zone) != 4:
+            raise ValueError("qr_zone must be (x, y, width, height)")
+        if not 0 <= png_compress_level <= 9:
+            raise ValueError("png_compress_level must be 0-9")
+        if png_color not in PNG_COLOR_MODES:
+            raise ValueError(f"Unknown PNG colour mode '{png_color}' (use one of {', '.join(PNG_COLOR_MODES)})")
+
+        values = {
+            "mode": mode, "version": int(version), "error_level": error_level, "font_path": font_path,
+            "width_mm": float(width_mm), "height_mm": float(height_mm), "dpi": int(dpi),
+            "output_svg": bool(output_svg), "include_url_text": bool(include_url_text),
+            "template_path": template_path, "qr_zone": qr_zone, "layout_path": layout_path,
+            "png_compress_level": int(png_compress_level), "png_optimize": bool(png_optimize), "png_color": png_color,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"StickerSpec is immutable, use spec.replace({name}=...)")
+
+    def __delattr__(self, name):
+        raise AttributeError("StickerSpec is immutable")
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        # Slots and a blocked __setattr__ rule out the default pickling; rebuild through __init__
+        return (type(self), self._values())
+
+    def __eq__(self, other):
+        if not isinstance(other, StickerSpec):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in zip(self.__slots__, self._values()))
+        return f"StickerSpec({fields})"
+
+    def replace(self, **changes) -> "StickerSpec":
+        """Returns a copy with the given fields changed."""
+        unknown = set(changes) - set(self.__slots__)
+        if unknown:
+            raise TypeError(f"Unknown StickerSpec field(s): {', '.join(sorted(unknown))}")
+        return type(self)(**{**self.as_settings(), **changes})
+
+    def as_settings(self) -> dict:
+        """The fields as a dict (batch settings keys, e.g. for batch.make_settings(**spec.as_settings()))."""
+        return dict(zip(self.__slots__, self._values()))
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "StickerSpec":
+        """Builds a spec from a batch settings dict; keys that are not spec fields are ignored."""
+        return cls(**{name: settings[name] for name in cls.__slots__ if name in settings})
+
+    @property
+    def is_svg(self) -> bool:
+        return self.mode == "rect" and self.output_svg
+
+    @property
+    def extension(self) -> str:
+        return ".svg" if self.is_svg else ".png"
+
+    @property
+    def png_options(self) -> dict:
+        return {"compress_level": self.png_compress_level, "optimize": self.png_optimize, "color": self.png_color}
+
+    @property
+    def png_dpi(self):
+        """DPI written into PNGs: the sticker DPI for rectangles, none for luggage tags (template pixels)."""
+        return self.dpi if self.mode == "rect" else None
+
+
+def render_image(url: str, spec: StickerSpec, caption=None, on_version_adjusted=None):
+    """
+    Renders the sticker for url as a Pillow image (RGB rectangle or RGBA luggage tag).
+    caption replaces the URL as the text; on_version_adjusted(requested, actual, url) is
+    called when the QR version had to be raised. SVG specs have no image: see render_svg().
+    """
+    if spec.mode == "luggage":
+        return render_luggage_tag_qr_image(
+            url, spec.version, spec.error_level, spec.template_path, spec.qr_zone,
+            on_version_adjusted=on_version_adjusted, font_path=spec.font_path, caption=caption,
+            layout_path=spec.layout_path
+        )
+    if spec.output_svg:
+        raise ValueError("SVG stickers are not rendered as images, use render_svg() or render_bytes()")
+    return render_rectangle_qr_image(
+        url, spec.width_mm, spec.height_mm, spec.dpi, spec.version, spec.error_level,
+        spec.include_url_text, spec.font_path, caption
+    )
+
+
+def render_svg(url: str, spec: StickerSpec, caption=None) -> str:
+    """Returns the SVG document for a rectangular sticker spec with output_svg set."""
+    if not spec.is_svg:
+        raise ValueError("render_svg() needs a rectangular spec with output_svg=True")
+    return render_rectangle_qr_svg(
+        url, spec.width_mm, spec.height_mm, spec.version, spec.error_level, spec.include_url_text, caption
+    )
+
+
+def render_to(url: str, spec: StickerSpec, target=None, caption=None, on_version_adjusted=None):
+    """
+    Renders the sticker file (PNG, or SVG for SVG specs) into target: a path or a writable
+    binary buffer. Without a target a new io.BytesIO is used. Returns the target, with
+    a new buffer rewound to the start.
+    """
+    buffer = io.BytesIO() if target is None else target
+    if spec.is_svg:
+        svg = render_svg(url, spec, caption)
+        with stage("save"):
+            if hasattr(buffer, "write"):
+                buffer.write(svg.encode("utf-8"))
+            else:
+                Path(buffer).write_text(svg, encoding="utf-8")
+    else:
+        img = render_image(url, spec, caption, on_version_adjusted)
+        save_png(img, buffer, spec.png_dpi, spec.png_options)
+    if target is None:
+        buffer.seek(0)
+    return buffer
+
+
+def render_bytes(url: str, spec: StickerSpec, caption=None, on_version_adjusted=None) -> bytes:
+    """Returns the sticker file contents (PNG, or UTF-8 SVG for SVG specs)."""
+    return render_to(url, spec, None, caption, on_version_adjusted).getvalue()
@@ -0,0 +1,82 @@
+# src/svg_sticker.py
+# Native SVG sticker writer: the QR modules become one merged <path>, the caption a <text>
+# element, and the document carries its physical size in mm. No Pillow involved.
+
+# Same proportions as the PNG sticker: QR takes ~75% of the height
+QR_HEIGHT_FRACTION = 0.75
+TOP_MARGIN_FRACTION = 0.05
+# Rough average glyph width of a sans-serif font, as a fraction of the font size
+AVG_CHAR_WIDTH_EM = 0.55
+
+
+def escape(text: str) -> str:
+    """XML-escapes text for element content and attribute values."""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+def matrix_to_path_data(matrix) -> str:
+    """
+    Path data covering all dark modules in module units. Horizontal runs of dark modules
+    are merged into one rectangle each, which keeps the path far smaller than one square per module.
+    """
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        width = len(row)
+        while x < width:
+            if not row[x]:
+                x += 1
+                continue
+            run_start = x
+            while x < width and row[x]:
+                x += 1
+            parts.append(f"M{run_start} {y}h{x - run_start}v1h-{x - run_start}z")
+    return "".join(parts)
+
+
+def _fmt(value: float) -> str:
+    return f"{value:.3f}".rstrip("0").rstrip(".")
+
+
+def build_svg_sticker(matrix, width_mm: float, height_mm: float, caption=None,
+                      font_family: str = "Arial, Helvetica, DejaVu Sans, sans-serif") -> str:
+    """
+    Returns the SVG document for a width_mm x height_mm sticker: the QR code from a module
+    matrix (as returned by generator.encode_qr) and, if given, a caption line under it.
+    User units are millimetres.
+    """
+    modules = len(matrix)
+    qr_size = height_mm * QR_HEIGHT_FRACTION
+    module_mm = qr_size / modules
+    qr_x = (width_mm - qr_size) / 2
+
+    elements = []
+    if caption:
+        qr_y = height_mm * TOP_MARGIN_FRACTION
+        band_top = qr_y + qr_size
+        band_height = height_mm - band_top
+        text = caption if len(caption) <= 80 else caption[:77] + "..."
+        max_text_width = width_mm * 0.9
+        font_size = min(band_height * 0.6, max_text_width / (AVG_CHAR_WIDTH_EM * max(len(text), 1)))
+        elements.append(
+            f'<text x="{_fmt(width_mm / 2)}" y="{_fmt(band_top + band_height / 2)}" '
+            f'font-family="{escape(font_family)}" font-size="{_fmt(font_size)}" '
+            f'text-anchor="middle" dominant-baseline="central" fill="#000">{escape(text)}</text>'
+        )
+    else:
+        qr_y = (height_mm - qr_size) / 2
+
+    # The white background also provides the quiet zone around the modules
+    elements.insert(0, (
+        f'<path transform="translate({_fmt(qr_x)} {_fmt(qr_y)}) scale({module_mm:.6f})" '
+        f'd="{matrix_to_path_data(matrix)}" fill="#000" shape-rendering="crispEdges"/>'
+    ))
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+        f'width="{_fmt(width_mm)}mm" height="{_fmt(height_mm)}mm" viewBox="0 0 {_fmt(width_mm)} {_fmt(height_mm)}">\n'
+        f'<rect width="{_fmt(width_mm)}" height="{_fmt(height_mm)}" fill="#fff"/>\n'
+        + "\n".join(elements)
+        + "\n</svg>\n"
+    )
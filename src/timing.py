@@ -0,0 +1,137 @@
+# src/timing.py
+# Lightweight per-stage timers for the generator. Disabled by default, in which case
+# stage() hands back a shared no-op context manager and costs almost nothing.
+# Batch workers send their totals back with each chunk (take/merge), so the summary
+# covers the whole batch; profile() wraps a run in cProfile.
+
+import threading
+import time
+from contextlib import contextmanager
+
+_enabled = False
+_totals = {}  # stage name -> [calls, total seconds]
+_lock = threading.Lock()  # PNG writer threads time their saves too
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            entry = _totals.get(self.name)
+            if entry is None:
+                _totals[self.name] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str):
+    """Context manager that adds the time spent in its block to the named stage."""
+    return _Stage(name) if _enabled else _NO_STAGE
+
+
+def enable(flag: bool = True):
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+def snapshot() -> dict:
+    """Returns {stage: {"calls": n, "total_ms": t}} for everything timed since the last reset()."""
+    with _lock:
+        return {name: {"calls": calls, "total_ms": total * 1000} for name, (calls, total) in _totals.items()}
+
+
+def take() -> dict:
+    """snapshot() and reset() in one step, e.g. at the end of each chunk in a batch worker."""
+    with _lock:
+        data = {name: {"calls": calls, "total_ms": total * 1000} for name, (calls, total) in _totals.items()}
+        _totals.clear()
+    return data
+
+
+def merge(data: dict):
+    """Adds a snapshot() from another process to this one's totals."""
+    with _lock:
+        for name, entry in data.items():
+            totals = _totals.setdefault(name, [0, 0.0])
+            totals[0] += entry["calls"]
+            totals[1] += entry["total_ms"] / 1000
+
+
+def format_summary(data: dict, items: int = 0, elapsed: float = None) -> str:
+    """
+    A table of the stages in data (a snapshot()), slowest first. items adds a per-sticker
+    column; stage time is summed over all worker processes and threads, so it can exceed elapsed.
+    """
+    total_ms = sum(entry["total_ms"] for entry in data.values())
+    lines = [f"{'stage':<12} {'calls':>8} {'total s':>9} {'ms/call':>8} {'share':>6}" + (f" {'ms/sticker':>10}" if items else "")]
+    for name, entry in sorted(data.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+        line = (f"{name:<12} {entry['calls']:>8} {entry['total_ms'] / 1000:>9.2f} "
+                f"{entry['total_ms'] / max(entry['calls'], 1):>8.2f} {entry['total_ms'] / total_ms if total_ms else 0:>6.1%}")
+        if items:
+            line += f" {entry['total_ms'] / items:>10.2f}"
+        lines.append(line)
+    if elapsed is not None:
+        lines.append(f"{len(data)} stages, {total_ms / 1000:.2f}s of stage time in {elapsed:.2f}s wall time")
+    return "\n".join(lines)
+
+
+def write_json(path, data: dict, **extra):
+    """Writes a snapshot() plus any extra fields (e.g. item count, elapsed seconds) as JSON."""
+    import json
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**extra, "stages": data}, f, indent=2)
+
+
+@contextmanager
+def profile(path=None, top: int = 25):
+    """
+    Runs the block under cProfile. Stats are saved to path (for pstats/snakeviz) and the
+    top functions by cumulative time are printed when the block ends.
+    """
+    import cProfile
+    import io
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(str(path))
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        print(out.getvalue())
@@ -1,8 +1,25 @@
+import queue
+import threading
+import time
+from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from .generator import create_rectangle_qr_image, create_luggage_tag_qr_image
+from PIL import ImageTk
+from .sticker import StickerSpec, render_to
+from .batch import make_settings, iter_batch_jobs, iter_batch_results
+from .csv_input import iter_csv_records
+from .manifest import BatchManifest
+from .precheck import PRECHECK_REPORT_FILENAME, precheck_batch
+from .preview import PREVIEW_SIZE, PreviewWorker
 from .utils import extract_slug, get_default_save_dir
-from .qr_info import get_max_chars, get_module_size
+from .qr_info import get_max_chars, get_module_size, NUMERIC
+
+# Small work units so Cancel takes effect quickly
+GUI_CHUNK_SIZE = 8
+PROGRESS_POLL_MS = 100
+# Live preview: wait for a pause in typing, then check often for the finished render
+PREVIEW_DEBOUNCE_MS = 150
+PREVIEW_POLL_MS = 20
 
 def launch_gui():
     # ======= Internal helper functions =======
@@ -16,44 +33,16 @@ def launch_gui():
                 messagebox.showerror("CSV Missing", "Please select a CSV file.")
                 return
             try:
-                with open(csv_path.get(), "r", encoding="utf-8") as f:
-                    lines = [line.strip() for line in f if line.strip()]
-                if len(lines) < 2:
+                # Peek at the first record only; the rest is streamed while rendering
+                if next(iter_csv_records(csv_path.get()), None) is None:
                     messagebox.showerror("CSV Format Error", "CSV must have at least two rows.")
                     return
-                base_url = lines[0]
-                suffixes = lines[1:]
 
                 saved_dir = filedialog.askdirectory(title="Select folder to save QR codes")
                 if not saved_dir:
                     return
 
-                for i, suffix in enumerate(suffixes, start=1):
-                    full_url = base_url + suffix
-                    slug = extract_slug(full_url)
-                    file_extension = ".png" # default
-                    if svg_output.get():
-                        file_extension = ".svg"
-                    filename = f"{saved_dir}/{i:03d}_{slug}{file_extension}"
-
-                    # Shared QR settings
-                    version = int(version_entry.get() or 4)
-                    error_level = error_level_var.get()
-
-                    if qr_type_var.get() == "Luggage Tag QR":
-                        tag_x = int(tag_x_entry.get())
-                        tag_y = int(tag_y_entry.get())
-                        tag_w = int(tag_width_entry.get())
-                        tag_h = int(tag_height_entry.get())
-                        template_path = None if use_template_var.get() else custom_template_path.get().strip() or None
-                        create_luggage_tag_qr_image(full_url, version, error_level, filename, template_path, (tag_x, tag_y, tag_w, tag_h))
-                    else:
-                        width_mm = float(rect_width_entry.get())
-                        height_mm = float(rect_height_entry.get())
-                        dpi = int(rect_dpi_entry.get())
-                        create_rectangle_qr_image(full_url, width_mm, height_mm, dpi, version, error_level, filename, svg_output.get(), include_url_output.get())
-
-                messagebox.showinfo("Batch Complete", f"QR codes saved to:\n{saved_dir}")
+                start_batch(csv_path.get(), saved_dir, read_batch_settings())
                 return
 
             except Exception as e:
@@ -65,69 +54,260 @@ def launch_gui():
             url = url_entry.get().strip()
             slug = extract_slug(url) # this is for a clear filename
 
-            # Get version + error correction level from UI
             try:
-                version = int(version_entry.get())
-            except ValueError:
-                version = 4  # fallback
-
-            error_level = error_level_var.get()  # "L", "M", "Q", or "H"
-
-            file_extension = ".png" # default
-            if svg_output.get():
-                file_extension = ".svg"
+                spec = read_spec()
+            except ValueError as e:
+                messagebox.showerror("Error", f"Enter valid QR settings.\n{e}")
+                return
 
             file_path = filedialog.asksaveasfilename(
-                defaultextension=".png",
-                filetypes=[("PNG files", "*.png")],
+                defaultextension=spec.extension,
+                filetypes=[("SVG files", "*.svg")] if spec.is_svg else [("PNG files", "*.png")],
                 title="Save QR code as...",
-                initialfile=f"{slug}{file_extension}",
+                initialfile=f"{slug}{spec.extension}",
                 initialdir=get_default_save_dir()
             )
             if not file_path:
                 return  # User cancelled
 
-            qr_type = qr_type_var.get()
+            render_to(url, spec, file_path, on_version_adjusted=show_version_adjusted)
 
-            try:
-                version = int(version_entry.get())
-            except ValueError:
-                version = 4  # Fallback default
+            messagebox.showinfo("Success", f"QR code saved to:\n{file_path}")
 
-            # --- Mode: Luggage Tag QR ---
-            if qr_type == "Luggage Tag QR":
-                try:
-                    tag_x = int(tag_x_entry.get())
-                    tag_y = int(tag_y_entry.get())
-                    tag_width = int(tag_width_entry.get())
-                    tag_height = int(tag_height_entry.get())
-                except ValueError:
-                    messagebox.showerror("Error", "Enter valid tag dimensions.")
-                    return
-                template_path = None if use_template_var.get() else custom_template_path.get().strip() or None
-                create_luggage_tag_qr_image(
-                    url, version, error_level, file_path, template_path,
-                    (tag_x, tag_y, tag_width, tag_height)
-                )
-            # --- Mode: Rectangular QR ---
-            else:
-                try:
-                    width_mm = float(rect_width_entry.get())
-                    height_mm = float(rect_height_entry.get())
-                    dpi = int(rect_dpi_entry.get())
-                except ValueError:
-                    messagebox.showerror("Error", "Enter valid rectangle QR settings.")
-                    return
-                create_rectangle_qr_image(
-                    url, width_mm, height_mm, dpi,
-                    version, error_level, file_path,
-                    svg_output.get(), include_url_output.get()
-                )
+    def show_version_adjusted(requested, actual, url):
+        messagebox.showinfo(
+            "Version Adjusted",
+            f"The selected QR version ({requested}) was too small to fit {len(url)} chars.\n"
+            f"It has been increased to version {actual} to fit your data."
+        )
 
-            messagebox.showinfo("Success", f"QR code saved to:\n{file_path}")
+    # Collects the sticker settings from the widgets (raises ValueError for invalid entries)
+    def read_spec():
+        try:
+            version = int(version_entry.get())
+        except ValueError:
+            version = 4  # fallback
+        if qr_type_var.get() == "Luggage Tag QR":
+            return StickerSpec(
+                "luggage", version, error_level_var.get(),
+                template_path=None if use_template_var.get() else custom_template_path.get().strip() or None,
+                qr_zone=(int(tag_x_entry.get()), int(tag_y_entry.get()), int(tag_width_entry.get()), int(tag_height_entry.get())),
+            )
+        return StickerSpec(
+            "rect", version, error_level_var.get(),
+            width_mm=float(rect_width_entry.get()),
+            height_mm=float(rect_height_entry.get()),
+            dpi=int(rect_dpi_entry.get()),
+            output_svg=svg_output.get(),
+            include_url_text=include_url_output.get(),
+        )
+
+    # Same settings for a batch (same keys as the headless CLI)
+    def read_batch_settings():
+        return make_settings(**read_spec().as_settings())
+
+    # ======= Background batch (keeps the window responsive) =======
+
+    # Shared between the Tk callbacks; "events" is filled by the batch thread
+    batch = {"thread": None, "cancel": None, "events": None, "close_when_done": False}
+
+    def run_batch_thread(csv_file, saved_dir, settings, events, cancel_event):
+        # Runs off the Tk main thread: only talks to the UI through the events queue
+        try:
+            # Quick pass so the progress bar knows the total, duplicates and URLs that
+            # are too long are left out, and the whole batch gets one QR version that
+            # fits every URL (no per-sticker adjustments)
+            check = precheck_batch(iter_csv_records(csv_file), settings)
+            settings = check.settings
+            events.put(("total", check.to_render))
+            if check.longest is not None:
+                events.put(("version", (settings["version"], check.longest.index)))
+            if check.issues:
+                report_path = Path(saved_dir) / PRECHECK_REPORT_FILENAME
+                check.write_report(report_path)
+                events.put(("precheck", (check.summary_lines(), report_path)))
+            jobs = iter_batch_jobs(check.filter(iter_csv_records(csv_file)), saved_dir, settings)
+            # Items a previous (interrupted) run already finished are skipped
+            with BatchManifest(saved_dir, settings) as manifest:
+                for result in iter_batch_results(jobs, settings, chunk_size=GUI_CHUNK_SIZE,
+                                                 manifest=manifest, cancel_event=cancel_event):
+                    events.put(("result", result))
+            events.put(("finished", cancel_event.is_set()))
+        except Exception as e:
+            events.put(("error", str(e)))
+
+    def start_batch(csv_file, saved_dir, settings):
+        events = queue.Queue()
+        cancel_event = threading.Event()
+        batch.update(
+            events=events, cancel=cancel_event, saved_dir=saved_dir, total=0, rendered=0,
+            skipped=0, failed=[], started=time.perf_counter(), close_when_done=False, version_note=None,
+            precheck_note=None
+        )
+        batch["thread"] = threading.Thread(
+            target=run_batch_thread, args=(csv_file, saved_dir, settings, events, cancel_event), daemon=True
+        )
+        create_button.config(state="disabled")
+        progress_bar.config(value=0, maximum=1)
+        progress_label.config(text="Starting batch...")
+        batch["thread"].start()
+        root.after(PROGRESS_POLL_MS, poll_batch)
+
+    def poll_batch():
+        events = batch["events"]
+        outcome = None
+        try:
+            while True:
+                kind, payload = events.get_nowait()
+                if kind == "total":
+                    batch["total"] = payload
+                    progress_bar.config(maximum=max(payload, 1))
+                elif kind == "version":
+                    batch["version_note"] = f"QR version raised to {payload[0]} to fit row {payload[1]}."
+                elif kind == "precheck":
+                    lines, report_path = payload
+                    batch["precheck_note"] = "\n".join(lines) + f"\nDetails: {report_path}"
+                elif kind == "result":
+                    if payload.skipped:
+                        batch["skipped"] += 1
+                    elif payload.error:
+                        batch["failed"].append(payload)
+                    else:
+                        batch["rendered"] += 1
+                else:
+                    outcome = (kind, payload)
+        except queue.Empty:
+            pass
+
+        update_progress()
+        if outcome is None:
+            root.after(PROGRESS_POLL_MS, poll_batch)
+        else:
+            finish_batch(*outcome)
+
+    def update_progress():
+        done = batch["rendered"] + batch["skipped"] + len(batch["failed"])
+        elapsed = time.perf_counter() - batch["started"]
+        rate = batch["rendered"] / elapsed if elapsed > 0 else 0
+        progress_bar.config(value=done)
+        text = f"{done}/{batch['total'] or '?'}  ·  {rate:.1f} stickers/sec"
+        remaining = batch["total"] - done
+        if rate > 0 and remaining > 0:
+            eta = int(remaining / rate)
+            text += f"  ·  ETA {eta // 60}:{eta % 60:02d}"
+        if batch["cancel"].is_set():
+            text += "  ·  cancelling..."
+        progress_label.config(text=text)
+
+    def finish_batch(kind, payload):
+        batch["thread"] = None
+        create_button.config(state="normal")
+        if batch["close_when_done"]:
+            root.destroy()
+            return
+
+        saved_dir = batch["saved_dir"]
+        failed = batch["failed"]
+        if kind == "error":
+            progress_label.config(text="Batch failed")
+            messagebox.showerror("Batch Generation Error", payload)
+        elif payload:
+            progress_label.config(text=f"Cancelled after {batch['rendered']} QR codes")
+            messagebox.showinfo("Batch Cancelled", f"{batch['rendered']} QR codes saved to:\n{saved_dir}\n\nRun the batch again to finish it.")
+        elif failed:
+            details = "\n".join(f"Row {r.index}: {r.error}" for r in failed[:10])
+            messagebox.showwarning(
+                "Batch Complete With Errors",
+                f"{batch['rendered']} QR codes saved to:\n{saved_dir}\n\n"
+                f"{len(failed)} failed:\n{details}"
+            )
+        else:
+            notes = [note for note in (batch["version_note"], batch["precheck_note"]) if note]
+            note = "".join(f"\n\n{note}" for note in notes)
+            messagebox.showinfo("Batch Complete", f"QR codes saved to:\n{saved_dir}{note}")
 
     def on_cancel():
-        root.destroy()
+        # Cancel a running batch first; otherwise close the app
+        if batch["thread"] is not None:
+            batch["cancel"].set()
+            update_progress()
+        else:
+            root.destroy()
+
+    def on_close_window():
+        if batch["thread"] is not None:
+            batch["cancel"].set()
+            batch["close_when_done"] = True
+        else:
+            root.destroy()
+
+    # ======= Live preview (rendered on the preview worker thread) =======
+
+    preview = {"after": None, "latest": 0, "polling": False, "photo": None, "note": ""}
+    preview_worker = PreviewWorker()
+
+    def schedule_preview(*_):
+        # Debounce: every change restarts the wait, so a burst of keystrokes renders once
+        if preview["after"] is not None:
+            root.after_cancel(preview["after"])
+        preview["after"] = root.after(PREVIEW_DEBOUNCE_MS, request_preview)
+
+    def request_preview():
+        preview["after"] = None
+        caption = None
+        if use_csv_var.get():
+            # First row of the CSV, with its label as the caption
+            try:
+                record = next(iter_csv_records(csv_path.get()), None) if csv_path.get().strip() else None
+            except Exception as e:
+                show_preview_message(f"Cannot read CSV: {e}")
+                return
+            url, caption = (record.url, record.label) if record is not None else ("", None)
+        else:
+            url = url_entry.get().strip()
+        if not url:
+            show_preview_message("Enter a URL (or pick a CSV) to see a preview")
+            return
+        try:
+            spec = read_spec()
+        except ValueError as e:
+            show_preview_message(f"Invalid settings: {e}")
+            return
+        preview["note"] = "  ·  SVG output, PNG layout shown" if spec.is_svg else ""
+        preview["latest"] = preview_worker.request(url, spec, caption)
+        if not preview["polling"]:
+            preview["polling"] = True
+            root.after(PREVIEW_POLL_MS, poll_preview)
+
+    def poll_preview():
+        latest = None
+        try:
+            while True:
+                number, result = preview_worker.results.get_nowait()
+                if number == preview["latest"]:
+                    latest = result
+        except queue.Empty:
+            pass
+        if latest is not None:
+            preview["polling"] = False
+            show_preview(latest)
+        else:
+            root.after(PREVIEW_POLL_MS, poll_preview)
+
+    def show_preview(result):
+        if result.error:
+            show_preview_message(result.error)
+            return
+        # Keep a reference: Tk does not, and the image disappears when the PhotoImage is freed
+        preview["photo"] = ImageTk.PhotoImage(result.image)
+        preview_label.config(image=preview["photo"], text="")
+        at_dpi = f" at {result.dpi} DPI" if result.dpi else ""
+        preview_status.config(text=f"Version {result.version}{at_dpi}  ·  {result.elapsed_ms:.0f} ms{preview['note']}")
+
+    def show_preview_message(text):
+        preview["photo"] = None
+        preview_label.config(image="", text=text)
+        preview_status.config(text="")
 
     def browse_for_template():
         path = filedialog.askopenfilename(filetypes=[("PNG files", "*.png")], title="Select tag template PNG")
@@ -151,9 +331,6 @@ def launch_gui():
         # Enable/disable mode-specific frames
         _toggle_mode_frames(selected_mode)
 
-        # Ensure URL checkbox is off in SVG mode
-        _force_disable_url_checkbox_if_svg()
-
         # Enable/disable template entry fields
         _update_template_field_states(selected_mode)
 
@@ -170,13 +347,6 @@ def launch_gui():
                 except tk.TclError:
                     pass
 
-    def _force_disable_url_checkbox_if_svg():
-        if svg_output.get():
-            try:
-                include_url_output_checkbox.config(state="disabled")
-            except tk.TclError:
-                pass
-
     def _update_template_field_states(selected_mode):
         try:
             if use_template_var.get():
@@ -215,9 +385,10 @@ def launch_gui():
             module_count = get_module_size(version)
             max_chars = get_max_chars(version, level)
             if max_chars == -1:
-                qr_size_label.config(text="(version >8 not supported for stats)")
+                qr_size_label.config(text="(QR version must be 1–40)")
             else:
-                qr_size_label.config(text=f"QR: {module_count}×{module_count} squares, Max chars: ~{max_chars}")
+                max_digits = get_max_chars(version, level, NUMERIC)
+                qr_size_label.config(text=f"QR: {module_count}×{module_count} squares, Max chars: {max_chars} (URL), {max_digits} (digits only)")
         except:
             qr_size_label.config(text="QR: ?×? squares, Max chars: ?")
     
@@ -234,13 +405,6 @@ def launch_gui():
             url_entry.config(state="normal")
             csv_browse_btn.config(state="disabled")
 
-    def toggle_svg_mode(*_):
-        if svg_output.get():
-            include_url_output_checkbox.config(state="disabled")
-            include_url_output.set(False)
-        else:
-            include_url_output_checkbox.config(state="normal")
-
 
     # ======= UI Layout =======
 
@@ -343,7 +507,7 @@ def launch_gui():
     svg_output_checkbox.grid(row=2, column=1, columnspan=3, sticky="w")
 
     include_url_output = tk.BooleanVar(value=False)
-    include_url_output_checkbox = tk.Checkbutton(rect_frame, text="Include URL in output (not with .svg)", variable=include_url_output)
+    include_url_output_checkbox = tk.Checkbutton(rect_frame, text="Include URL in output", variable=include_url_output)
     include_url_output_checkbox.grid(row=3, column=1, columnspan=3, sticky="w")
 
 
@@ -386,23 +550,52 @@ def launch_gui():
     template_browse_btn.pack(side="left")
     custom_file_row.grid(row=3, column=0, columnspan=4, padx=(0, 5), pady=5)
 
+    # --- Live preview ---
+    preview_frame = tk.LabelFrame(root, text="Preview")
+    preview_frame.pack(padx=10, pady=5, fill="x")
+    preview_box = tk.Frame(preview_frame, width=PREVIEW_SIZE[0], height=PREVIEW_SIZE[1])
+    preview_box.pack_propagate(False)  # fixed size, so the window does not jump while typing
+    preview_box.pack(pady=(5, 0))
+    preview_label = tk.Label(preview_box, wraplength=PREVIEW_SIZE[0])
+    preview_label.pack(expand=True)
+    preview_status = tk.Label(preview_frame, text="")
+    preview_status.pack()
+
+    # --- Batch progress ---
+    progress_frame = tk.Frame(root)
+    progress_frame.pack(padx=10, pady=(5, 0), fill="x")
+    progress_bar = ttk.Progressbar(progress_frame, mode="determinate")
+    progress_bar.pack(fill="x")
+    progress_label = tk.Label(progress_frame, text="")
+    progress_label.pack()
+
     # --- Action buttons ---
     button_frame = tk.Frame(root)
     button_frame.pack(pady=10)
-    tk.Button(button_frame, text="Create", width=10, command=on_create).grid(row=0, column=0, padx=5)
+    create_button = tk.Button(button_frame, text="Create", width=10, command=on_create)
+    create_button.grid(row=0, column=0, padx=5)
     tk.Button(button_frame, text="Cancel", width=10, command=on_cancel).grid(row=0, column=1, padx=5)
+    root.protocol("WM_DELETE_WINDOW", on_close_window)
 
     # --- Reactive logic bindings ---
     use_template_var.trace_add("write", toggle_template_fields)
     qr_type_var.trace_add("write", toggle_mode_fields)
     use_csv_var.trace_add("write", toggle_url_mode)
-    svg_output.trace_add("write", toggle_svg_mode)
+
+    # Any change that affects the sticker refreshes the preview
+    for entry in (url_entry, version_entry, rect_width_entry, rect_height_entry, rect_dpi_entry,
+                  tag_x_entry, tag_y_entry, tag_width_entry, tag_height_entry, template_path_entry):
+        entry.bind("<KeyRelease>", schedule_preview, add="+")
+    for var in (error_level_var, qr_type_var, svg_output, include_url_output,
+                use_template_var, custom_template_path, use_csv_var, csv_path):
+        var.trace_add("write", schedule_preview)
 
     
     # --- Initial states ---
     toggle_url_mode() 
     toggle_mode_fields() 
     toggle_template_fields()
-    toggle_svg_mode()
+    request_preview()
 
     root.mainloop()
+    preview_worker.close()
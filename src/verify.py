@@ -0,0 +1,417 @@
+# src/verify.py
+# Pre-flight scan check for rendered stickers: finds the QR symbol in the output image
+# the way a scanner does (by its three finder patterns), samples every module, decodes
+# the format information and data bits of the sampled grid back to a payload and compares
+# the grid with a fresh encoding of the source URL (made with qrcode directly, never taken
+# from the encode cache the renderer used). Also measures the module size in pixels and
+# the quiet zone around the symbol. If pyzbar is installed, the image is decoded with ZBar
+# as well and the payload has to equal the URL.
+
+import csv
+import io
+import re
+from collections import namedtuple
+from PIL import Image
+from .generator import ERROR_CORRECTION_MAP
+from .qr_info import NUMERIC, ALPHANUMERIC, BYTE, count_bits
+from .timing import stage
+
+VERIFY_REPORT_FILENAME = "qr_verify_report.csv"
+
+# Smallest module size (px) and quiet zone (modules) that pass by default; print scanners
+# want at least ~2 px per module and ISO 18004 a 4-module quiet zone. The generator only
+# renders a 1-module border, the rest has to come from the white sticker around it.
+DEFAULT_MIN_MODULE_PX = 2.0
+DEFAULT_MIN_QUIET_ZONE = 4
+
+# Widest quiet zone measured; anything larger reads as this many modules
+MAX_QUIET_ZONE = 4
+
+# ok is False with error set when the check failed; module_px/quiet_zone are None if no
+# symbol was found. decoder names what checked the payload: "grid-match" (the sampled
+# modules, decoded here and matched against a fresh encoding) or "zbar".
+VerifyResult = namedtuple("VerifyResult", ["ok", "module_px", "quiet_zone", "decoder", "error"])
+
+_RUNS = re.compile(rb"\x00+|\xff+")
+
+# Format information: error correction bits -> level (ISO 18004 table 12)
+_FORMAT_LEVELS = {value: level for level, value in ERROR_CORRECTION_MAP.items()}
+_MODE_INDICATORS = {0b0001: NUMERIC, 0b0010: ALPHANUMERIC, 0b0100: BYTE}
+_ALPHANUMERIC_TABLE = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+
+
+def _zbar_decode():
+    try:
+        from pyzbar.pyzbar import decode
+    except ImportError:  # optional dependency (and its libzbar)
+        return None
+    return decode
+
+
+def should_verify(index: int, every: int) -> bool:
+    """True for the items a batch checks: none for every=0, all for 1, else 1 in every (from item 1)."""
+    return every > 0 and (index - 1) % every == 0
+
+
+def load_bilevel(source) -> Image.Image:
+    """Opens a PNG (path, bytes or image) as a black/white "L" image; transparency reads as white."""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    if img.mode in ("RGBA", "LA", "PA", "P"):
+        img = img.convert("RGBA")
+        flat = Image.new("RGBA", img.size, "white")
+        flat.alpha_composite(img)
+        img = flat
+    return img.convert("L").point(lambda v: 255 if v >= 128 else 0)
+
+
+def _finder_candidates(pixels: bytes, width: int, height: int):
+    """Yields (cx, cy, module_px) for 1:1:3:1:1 dark/light runs found along rows, confirmed along the column."""
+    for y in range(height):
+        row = pixels[y * width:(y + 1) * width]
+        runs = [(m.start(), m.end() - m.start(), row[m.start()] == 0) for m in _RUNS.finditer(row)]
+        for i in range(len(runs) - 4):
+            start, _, dark = runs[i]
+            if not dark:
+                continue
+            lengths = [runs[i + k][1] for k in range(5)]
+            if _is_finder_ratio(lengths):
+                module = sum(lengths) / 7
+                cx = start + sum(lengths) / 2
+                if _column_matches(pixels, width, height, int(cx), y, module):
+                    yield cx, y, module
+
+
+def _is_finder_ratio(lengths) -> bool:
+    module = sum(lengths) / 7
+    if module < 1:
+        return False
+    tolerance = module / 2 + 0.5
+    return all(abs(length - module * weight) <= tolerance * weight for length, weight in zip(lengths, (1, 1, 3, 1, 1)))
+
+
+def _column_matches(pixels: bytes, width: int, height: int, x: int, y: int, module: float) -> bool:
+    """The row hit at (x, y) must also cross a finder vertically: 1:1:3:1:1 runs with y in the middle one."""
+    column = bytes(pixels[row * width + x] for row in range(height))
+    runs = [(m.start(), m.end() - m.start()) for m in _RUNS.finditer(column)]
+    for i, (start, length) in enumerate(runs):
+        if start <= y < start + length:
+            if column[y] != 0 or i < 2 or i + 2 >= len(runs):
+                return False
+            lengths = [runs[k][1] for k in range(i - 2, i + 3)]
+            return _is_finder_ratio(lengths) and abs(sum(lengths) / 7 - module) <= module / 2
+    return False
+
+
+def _locate_symbol(candidates, size_hint: int):
+    """
+    Yields (left, top, module_px) for every top-left, top-right and bottom-left finder
+    triple among the candidates that fits a symbol of size_hint modules.
+    """
+    # One centre per finder: average the rows that hit the same finder
+    finders = []
+    for cx, cy, module in candidates:
+        for f in finders:
+            if abs(f[0] - cx) <= module and abs(f[1] / f[3] - cy) <= module * 2:
+                f[1] += cy
+                f[2] += module
+                f[3] += 1
+                break
+        else:
+            finders.append([cx, cy, module, 1])
+    # A real finder is hit by every row through its 3-module centre; stray 1:1:3:1:1 runs
+    # in the data area by a module's worth of rows at most
+    finders = [(cx, cy / n, module / n) for cx, cy, module, n in finders if n >= 2 * (module / n)]
+    finders.sort(key=lambda f: (f[1], f[0]))
+
+    for tl in finders:
+        module = tl[2]
+        expected = (size_hint - 7) * module
+        for tr in finders:
+            if tr is tl or abs(tr[1] - tl[1]) > module * 2 or abs(tr[0] - tl[0] - expected) > module * 3:
+                continue
+            for bl in finders:
+                if bl is tl or abs(bl[0] - tl[0]) > module * 2 or abs(bl[1] - tl[1] - expected) > module * 3:
+                    continue
+                # Module size from the finder spacing is more accurate than from one finder
+                spacing = ((tr[0] - tl[0]) + (bl[1] - tl[1])) / 2 / (size_hint - 7)
+                yield tl[0] - 3.5 * spacing, tl[1] - 3.5 * spacing, spacing
+
+
+def _sample_grid(pixels: bytes, width: int, height: int, left: float, top: float, module: float, size: int):
+    """Rows of module values read at each module's centre: True = dark, None = outside the image."""
+    grid = []
+    for r in range(size):
+        y = int(top + (r + 0.5) * module)
+        row = []
+        for c in range(size):
+            x = int(left + (c + 0.5) * module)
+            row.append(pixels[y * width + x] == 0 if 0 <= x < width and 0 <= y < height else None)
+        grid.append(row)
+    return grid
+
+
+def _count_mismatches(grid, expected) -> int:
+    """Modules of the sampled grid that differ from the expected matrix."""
+    return sum(cell is None or cell != bool(dark) for row, expected_row in zip(grid, expected)
+               for cell, dark in zip(row, expected_row))
+
+
+def _reference_matrix(url: str, version: int, error_level: str):
+    """url encoded afresh with qrcode as the generator does, bypassing the encode cache; no quiet zone."""
+    import qrcode
+    qr = qrcode.QRCode(version=version, border=0,
+                       error_correction=ERROR_CORRECTION_MAP.get(error_level.upper(), ERROR_CORRECTION_MAP["M"]))
+    qr.add_data(url, optimize=0)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _read_format(grid):
+    """(error correction bits, mask pattern) from the better of the two format information copies."""
+    from qrcode.util import BCH_type_info
+    n = len(grid)
+    vertical = [grid[i][8] if i < 6 else grid[i + 1][8] if i < 8 else grid[n - 15 + i][8] for i in range(15)]
+    horizontal = [grid[8][n - i - 1] if i < 8 else grid[8][15 - i] if i < 9 else grid[8][14 - i] for i in range(15)]
+    best, distance = None, 16
+    for copy in (vertical, horizontal):
+        bits = sum(1 << i for i, dark in enumerate(copy) if dark)
+        for data in range(32):
+            d = bin(bits ^ BCH_type_info(data)).count("1")
+            if d < distance:
+                best, distance = data, d
+    # The BCH code corrects up to 3 bit errors
+    if distance > 3:
+        raise ValueError("format information is unreadable")
+    return best >> 3, best & 7
+
+
+def _function_modules(version: int):
+    """Rows of flags marking the modules that carry no data (finders, timing, alignment, format, version)."""
+    from qrcode.util import pattern_position
+    n = 17 + 4 * version
+    fixed = [[False] * n for _ in range(n)]
+
+    def mark(top, left, rows, cols):
+        for r in range(max(top, 0), min(top + rows, n)):
+            for c in range(max(left, 0), min(left + cols, n)):
+                fixed[r][c] = True
+
+    # Finders with their separators and the format information (and dark module) next to them
+    mark(0, 0, 9, 9)
+    mark(0, n - 8, 9, 8)
+    mark(n - 8, 0, 8, 9)
+    centres = pattern_position(version)
+    for r in centres:
+        for c in centres:
+            if not fixed[r][c]:  # alignment patterns never overlap a finder
+                mark(r - 2, c - 2, 5, 5)
+    mark(6, 0, 1, n)
+    mark(0, 6, n, 1)
+    if version >= 7:
+        mark(0, n - 11, 6, 3)
+        mark(n - 11, 0, 3, 6)
+    return fixed
+
+
+def _read_data_bits(grid, version: int, mask: int):
+    """The unmasked data and error correction bits in placement order (the generator's zigzag)."""
+    from qrcode.util import mask_func
+    fixed = _function_modules(version)
+    masked = mask_func(mask)
+    n = len(grid)
+    bits = []
+    row, step = n - 1, -1
+    for col in range(n - 1, 0, -2):
+        if col <= 6:
+            col -= 1  # skip the vertical timing pattern
+        for _ in range(n):
+            for c in (col, col - 1):
+                if not fixed[row][c]:
+                    bits.append(bool(grid[row][c]) != masked(row, c))
+            row += step
+        row -= step
+        step = -step
+    return bits
+
+
+def decode_grid(grid) -> str:
+    """
+    Decodes a sampled module grid (rows of truthy = dark, no quiet zone) to its payload.
+    There is no Reed-Solomon correction: a grid with damaged data modules raises ValueError
+    or decodes to a different payload. Numeric, alphanumeric and byte (UTF-8) segments.
+    """
+    from qrcode.base import rs_blocks
+    size = len(grid)
+    version = (size - 17) // 4
+    if size < 21 or (size - 17) % 4:
+        raise ValueError(f"{size} modules per side is not a QR code size")
+    ec_bits, mask = _read_format(grid)
+    bits = _read_data_bits(grid, version, mask)
+    codewords = [sum(bit << (7 - i) for i, bit in enumerate(bits[k:k + 8])) for k in range(0, len(bits) - 7, 8)]
+
+    # Data codewords are interleaved across the error correction blocks
+    blocks = rs_blocks(version, ec_bits)
+    data = [[] for _ in blocks]
+    position = 0
+    for k in range(max(block.data_count for block in blocks)):
+        for block, block_data in zip(blocks, data):
+            if k < block.data_count:
+                block_data.append(codewords[position])
+                position += 1
+    stream = [(cw >> (7 - i)) & 1 for block_data in data for cw in block_data for i in range(8)]
+
+    pos = 0
+
+    def read(count):
+        nonlocal pos
+        if pos + count > len(stream):
+            raise ValueError("data runs past the end of the symbol")
+        value = 0
+        for bit in stream[pos:pos + count]:
+            value = value << 1 | bit
+        pos += count
+        return value
+
+    text = []
+    while len(stream) - pos >= 4:
+        indicator = read(4)
+        if indicator == 0:  # terminator
+            break
+        mode = _MODE_INDICATORS.get(indicator)
+        if mode is None:
+            raise ValueError(f"unsupported segment mode {indicator:04b}")
+        count = read(count_bits(mode, version))
+        if mode == NUMERIC:
+            digits = []
+            for group in [3] * (count // 3) + ([count % 3] if count % 3 else []):
+                digits.append(f"{read((0, 4, 7, 10)[group]):0{group}d}")
+            text.append("".join(digits))
+        elif mode == ALPHANUMERIC:
+            chars = []
+            for _ in range(count // 2):
+                value = read(11)
+                chars.append(_ALPHANUMERIC_TABLE[value // 45] + _ALPHANUMERIC_TABLE[value % 45])
+            if count % 2:
+                chars.append(_ALPHANUMERIC_TABLE[read(6)])
+            text.append("".join(chars))
+        else:
+            text.append(bytes(read(8) for _ in range(count)).decode("utf-8", "replace"))
+    return "".join(text)
+
+
+def _quiet_zone(pixels: bytes, width: int, height: int, left: float, top: float, module: float, size: int) -> int:
+    """Whole light modules around the symbol on its narrowest side (up to MAX_QUIET_ZONE)."""
+    right, bottom = left + size * module, top + size * module
+    zone = MAX_QUIET_ZONE
+    for side in range(4):
+        clear = 0
+        for step in range(1, MAX_QUIET_ZONE + 1):
+            # Sample the ring step modules outside the symbol along this side
+            if side == 0:
+                points = [(left - (step - 0.5) * module, top + (i + 0.5) * module) for i in range(size)]
+            elif side == 1:
+                points = [(right + (step - 0.5) * module, top + (i + 0.5) * module) for i in range(size)]
+            elif side == 2:
+                points = [(left + (i + 0.5) * module, top - (step - 0.5) * module) for i in range(size)]
+            else:
+                points = [(left + (i + 0.5) * module, bottom + (step - 0.5) * module) for i in range(size)]
+            if any(not (0 <= x < width and 0 <= y < height) or pixels[int(y) * width + int(x)] == 0 for x, y in points):
+                break
+            clear = step
+        zone = min(zone, clear)
+    return zone
+
+
+def verify_qr_image(source, url: str, version: int = 4, error_level: str = "M",
+                    min_module_px: float = DEFAULT_MIN_MODULE_PX, min_quiet_zone: int = DEFAULT_MIN_QUIET_ZONE) -> VerifyResult:
+    """
+    Checks that the QR code in source (PNG path, PNG bytes or image) reads as url.
+    Every module is sampled at its centre; the sampled grid has to decode to url and match
+    a fresh encoding of url (version and error_level as given to the generator).
+    """
+    with stage("verify"):
+        img = load_bilevel(source)
+        width, height = img.size
+        pixels = img.tobytes()
+
+        expected = _reference_matrix(url, version, error_level)
+        size = len(expected)
+
+        # Keep the placement that reads best if stray patterns gave more than one
+        found, grid, mismatches = None, None, None
+        for placement in _locate_symbol(_finder_candidates(pixels, width, height), size):
+            sampled = _sample_grid(pixels, width, height, *placement, size)
+            count = _count_mismatches(sampled, expected)
+            if mismatches is None or count < mismatches:
+                found, grid, mismatches = placement, sampled, count
+                if not count:
+                    break
+        if found is None:
+            return VerifyResult(False, None, None, "grid-match", "no QR code found")
+        left, top, module = found
+
+        quiet_zone = _quiet_zone(pixels, width, height, left, top, module, size)
+        module_px = round(module, 2)
+
+        decoder, error = "grid-match", None
+        try:
+            payload = decode_grid(grid)
+        except ValueError as e:
+            error = f"QR code does not decode: {e}"
+        else:
+            if payload != url:
+                error = f"decoded {payload!r} instead of the URL"
+        if error is None and mismatches:
+            error = f"{mismatches} of {size * size} modules differ from a fresh encoding of the URL"
+        if error is None:
+            decode = _zbar_decode()
+            if decode is not None:
+                decoder = "zbar"
+                payloads = [symbol.data.decode("utf-8", "replace") for symbol in decode(img)]
+                if url not in payloads:
+                    error = f"decoded {payloads[0]!r} instead of the URL" if payloads else "ZBar could not decode the QR code"
+        if error is None and module < min_module_px:
+            error = f"modules are {module_px} px, below the {min_module_px} px minimum"
+        if error is None and quiet_zone < min_quiet_zone:
+            error = f"quiet zone is {quiet_zone} module(s), below the {min_quiet_zone} module minimum"
+        return VerifyResult(error is None, module_px, quiet_zone, decoder, error)
+
+
+class VerifyReport:
+    """CSV report of scan-checked batch items (batch.ItemResult with check set), written as they arrive."""
+
+    def __init__(self, path):
+        self.path = path
+        self.checked = 0
+        self.failed = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, result):
+        if result.check is None:
+            return
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["index", "url", "filename", "ok", "module_px", "quiet_zone_modules", "decoder", "error"])
+        check = result.check
+        self.checked += 1
+        if not check.ok:
+            self.failed += 1
+        self._writer.writerow([
+            result.index, result.url, result.filename, "yes" if check.ok else "no",
+            check.module_px, check.quiet_zone, check.decoder, check.error or ""
+        ])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,81 @@
+# src/writer.py
+# Output stage for rendered stickers: PNG encoding options and a bounded pool of writer
+# threads so rendering the next sticker overlaps with compressing/writing the last one.
+# Pillow releases the GIL while it compresses, so threads are enough here.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from .timing import stage
+
+# PNG colour modes for black-and-white stickers, smallest last
+PNG_COLOR_MODES = ["rgb", "L", "P", "1"]
+
+DEFAULT_PNG_OPTIONS = {
+    "compress_level": 6,    # zlib level 0-9 (Pillow's default is 6)
+    "optimize": False,      # extra zlib pass for the smallest file, much slower
+    "color": "rgb",         # "rgb" (as rendered), "L" greyscale, "P" 16-colour palette, "1" bilevel
+}
+
+
+def convert_for_png(img: Image.Image, color: str = "rgb") -> Image.Image:
+    """
+    Converts a black-and-white sticker to a smaller PNG colour mode. Images with an alpha
+    channel (luggage tags on a shaped template) keep their mode so transparency survives.
+    """
+    if color == "rgb" or img.mode in ("RGBA", "LA", "PA") or img.mode == color:
+        return img
+    if color == "L":
+        return img.convert("L")
+    if color == "1":
+        # Threshold rather than dither: modules stay solid, text edges go hard
+        return img.convert("L").point(lambda v: 255 if v >= 128 else 0, mode="1")
+    if color == "P":
+        # A few grey levels keep the anti-aliased caption smooth
+        return img.convert("L").convert("P", palette=Image.Palette.ADAPTIVE, colors=16)
+    raise ValueError(f"Unknown PNG colour mode '{color}' (use one of {', '.join(PNG_COLOR_MODES)})")
+
+
+def save_png(img: Image.Image, filename, dpi=None, png_options=None):
+    """Saves img as a PNG with the given options (see DEFAULT_PNG_OPTIONS)."""
+    options = dict(DEFAULT_PNG_OPTIONS)
+    options.update(png_options or {})
+    with stage("save"):
+        img = convert_for_png(img, options["color"])
+        params = {"compress_level": options["compress_level"], "optimize": options["optimize"]}
+        if dpi:
+            params["dpi"] = (dpi, dpi)
+        img.save(filename, "PNG", **params)
+
+
+class ImageWriter:
+    """
+    Saves images on a small thread pool. submit() blocks once max_pending images are
+    waiting (backpressure), so memory stays bounded when the disk is slower than rendering.
+    """
+
+    def __init__(self, threads: int = 2, max_pending: int = 8, png_options=None):
+        self.png_options = png_options
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="png-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, img: Image.Image, filename, dpi=None):
+        """Queues img to be saved as filename; returns a Future that raises if saving failed."""
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(save_png, img, filename, dpi, self.png_options)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self):
+        """Waits for all queued images to be written."""
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()